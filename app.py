@@ -1,26 +1,47 @@
+import time
+# Startup timing starts before the remaining imports, see startup_phase()
+startup_started = time.monotonic()
 import os
+import re
+import json
+import hashlib
+import copy
 import tempfile
+import threading
 import uuid
-import time
 import logging
 import ssl
+import socket
+import fcntl
+import queue
+from contextlib import contextmanager, ExitStack
+from collections import deque, OrderedDict
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait as wait_futures
 import certifi
 import urllib.request
 import requests
 import subprocess
 import shutil
-from flask import Flask, request, jsonify, send_file, render_template, make_response
+import atexit
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
-import yt_dlp
-# Import pytube for alternative YouTube download method
-try:
-    from pytube import YouTube
-except ImportError:
-    YouTube = None
-import whisper  # This is now openai-whisper
+from werkzeug.datastructures import ContentRange
+from werkzeug.wsgi import ClosingIterator
+# torch, whisper (openai-whisper), yt_dlp and pytube are slow to import and
+# are imported on first use or by the background startup thread
 import numpy as np
-import torch
 from dotenv import load_dotenv
+import audio_processing
+import inference
+import engines
+import cpu_runtime
+import janitor
+import storage
+
+# Per-phase startup timings, in seconds, in the order the phases finished
+startup_timings = OrderedDict()
+startup_timings["imports"] = round(time.monotonic() - startup_started, 3)
 
 # Configure SSL with enhanced techniques
 def configure_ssl():
@@ -90,213 +111,2946 @@ CORS(app)
 TEMP_DIR = os.environ.get("TEMP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp"))
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-# Load the actual Whisper model
+# Persistent audio cache, keyed by YouTube video ID, so repeat requests skip
+# the network fetch and the ffmpeg transcode
+AUDIO_CACHE_ENABLED = os.environ.get("AUDIO_CACHE_ENABLED", "1") == "1"
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", os.path.join(TEMP_DIR, "audio_cache"))
+os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+
+# The caches are size-budgeted stores (see storage.py) that evict the least
+# recently ("lru") or least frequently ("lfu") used entries first; a budget
+# of 0 disables it
+CACHE_EVICTION_POLICY = os.environ.get("CACHE_EVICTION_POLICY", "lru")
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+audio_store = storage.Storage(AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES, policy=CACHE_EVICTION_POLICY)
+
+# yt-dlp format for the transcription path: the smallest audio-only stream
+# is plenty for Whisper, which resamples everything to 16 kHz mono anyway
+TRANSCRIBE_AUDIO_FORMAT = os.environ.get("TRANSCRIBE_AUDIO_FORMAT", "worstaudio[abr>=?32]/worstaudio/bestaudio/best")
+
+# Stream the source audio through ffmpeg straight into memory for /transcribe
+# instead of writing it to TEMP_DIR first
+TRANSCRIBE_STREAMING = os.environ.get("TRANSCRIBE_STREAMING", "1") == "1"
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 10 * 1024 * 1024))
+
+# Stream /downloads: encode the MP3 while the source audio downloads and
+# send it as it is produced, instead of downloading and transcoding the
+# whole file first. Requests can override it with ?stream=0/1.
+DOWNLOAD_STREAMING = os.environ.get("DOWNLOAD_STREAMING", "1") == "1"
+download_stream_stats = {
+    "started": 0, "coalesced": 0, "completed": 0, "cancelled": 0, "failed": 0, "fallbacks": 0, "bytes": 0,
+    "not_modified": 0, "ranges": 0
+}
+download_stream_lock = threading.Lock()
+
+# Cached MP3s are sent with a strong ETag, byte-range support and this
+# Cache-Control max-age, so browsers and CDNs can reuse and resume them
+DOWNLOAD_MAX_AGE = int(os.environ.get("DOWNLOAD_MAX_AGE", 86400))
+
+# Hedged downloads: start the next download method in parallel when the
+# running ones show no progress for HEDGE_DELAY seconds; the first to finish wins
+HEDGED_DOWNLOADS = os.environ.get("HEDGED_DOWNLOADS", "0") == "1"
+HEDGE_DELAY = float(os.environ.get("HEDGE_DELAY", 10))
+HEDGE_MAX_PARALLEL = int(os.environ.get("HEDGE_MAX_PARALLEL", 2))
+
+# Download methods are reordered by recent success rate and latency; a method
+# that fails METHOD_BREAKER_THRESHOLD times in a row is skipped, then retried
+# with a single probe every METHOD_BREAKER_COOLDOWN seconds
+METHOD_STATS_WINDOW = int(os.environ.get("METHOD_STATS_WINDOW", 20))
+METHOD_BREAKER_THRESHOLD = int(os.environ.get("METHOD_BREAKER_THRESHOLD", 3))
+METHOD_BREAKER_COOLDOWN = float(os.environ.get("METHOD_BREAKER_COOLDOWN", 300))
+
+# Idle yt-dlp instances kept per option profile, and the connection pool size
+# of the HTTP session shared by the direct download paths
+YTDL_POOL_SIZE = int(os.environ.get("YTDL_POOL_SIZE", 4))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
+
+# Video metadata from yt-dlp is cached per worker for VIDEO_INFO_TTL seconds
+# (well below the lifetime of YouTube's signed stream URLs)
+VIDEO_INFO_TTL = float(os.environ.get("VIDEO_INFO_TTL", 1800))
+VIDEO_INFO_CACHE_SIZE = int(os.environ.get("VIDEO_INFO_CACHE_SIZE", 256))
+
+# Long-audio mode: audio longer than LONG_AUDIO_THRESHOLD seconds is split at
+# quiet points into overlapping chunks that are transcribed in parallel by a
+# pool of LONG_AUDIO_WORKERS processes, each holding its own copy of the model.
+# Disabled unless LONG_AUDIO_WORKERS is at least 2.
+LONG_AUDIO_WORKERS = int(os.environ.get("LONG_AUDIO_WORKERS", 0))
+LONG_AUDIO_THRESHOLD = float(os.environ.get("LONG_AUDIO_THRESHOLD", 1200))
+LONG_AUDIO_CHUNK_SECONDS = float(os.environ.get("LONG_AUDIO_CHUNK_SECONDS", 300))
+LONG_AUDIO_OVERLAP_SECONDS = float(os.environ.get("LONG_AUDIO_OVERLAP_SECONDS", 5))
+
+# Cross-request batching: 30-second windows from concurrent transcriptions in
+# this worker are decoded together in batches of up to INFERENCE_BATCH_SIZE,
+# waiting at most INFERENCE_BATCH_WAIT_MS for a batch to fill. Needs
+# JOB_WORKERS > 1 to have concurrent transcriptions; disabled unless
+# INFERENCE_BATCH_SIZE is at least 2.
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", 0))
+INFERENCE_BATCH_WAIT_MS = float(os.environ.get("INFERENCE_BATCH_WAIT_MS", 50))
+
+# Voice activity detection: transcribe only the speech regions of the audio.
+# Requests can override the default with the "vad" field.
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "0") == "1"
+
+# Whisper's input format: 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# Shared HTTP session with keep-alive connections. SSL verification is off
+# to match configure_ssl(), which ran once at import.
+http_session = requests.Session()
+http_session.verify = False
+http_adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+http_session.mount("https://", http_adapter)
+http_session.mount("http://", http_adapter)
+
+# Unprocessed yt-dlp info by video ID: {key: (expires_at, info)}, in LRU order
+video_info_cache = OrderedDict()
+video_info_lock = threading.Lock()
+video_info_stats = {"hits": 0, "misses": 0}
+
+# Long-audio process pool, see get_long_audio_pool()
+long_audio_pool = None
+long_audio_pool_lock = threading.Lock()
+
+# Hit/miss counters for the audio cache (per worker process)
+audio_cache_stats = {"hits": 0, "misses": 0, "stores": 0}
+audio_cache_lock = threading.Lock()
+
+# Transcription result cache, keyed by (video ID, model, decode options), so
+# repeat requests skip both the download and the inference
+TRANSCRIPTION_CACHE_ENABLED = os.environ.get("TRANSCRIPTION_CACHE_ENABLED", "1") == "1"
+TRANSCRIPTION_CACHE_DIR = os.environ.get("TRANSCRIPTION_CACHE_DIR", os.path.join(TEMP_DIR, "transcription_cache"))
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_ENTRIES", 500))
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", 0))
+transcription_store = storage.Storage(
+    TRANSCRIPTION_CACHE_DIR,
+    max_bytes=TRANSCRIPTION_CACHE_MAX_BYTES,
+    max_entries=TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    policy=CACHE_EVICTION_POLICY
+)
+
+transcription_cache_stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+transcription_cache_lock = threading.Lock()
+
+# Background transcription jobs. The pool bounds how many downloads and
+# Whisper runs execute at once in this worker, independently of how many
+# HTTP requests are being served. Job state is written to JOBS_DIR so any
+# gunicorn worker can report on it.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", 100))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 3600))
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(TEMP_DIR, "jobs"))
+os.makedirs(JOBS_DIR, exist_ok=True)
+
+# TEMP_DIR housekeeping (see janitor.py): request directories left behind by
+# crashed requests are removed after TEMP_DIR_ORPHAN_AGE seconds, and while
+# TEMP_DIR holds more than TEMP_DIR_MAX_BYTES or its volume has less than
+# TEMP_DIR_MIN_FREE_BYTES free, cached audio and transcriptions are evicted
+# by the caches' eviction policy. Checked every TEMP_DIR_SWEEP_INTERVAL
+# seconds; a limit of 0 disables it.
+TEMP_DIR_MAX_BYTES = int(os.environ.get("TEMP_DIR_MAX_BYTES", 0))
+TEMP_DIR_MIN_FREE_BYTES = int(os.environ.get("TEMP_DIR_MIN_FREE_BYTES", 1024 * 1024 * 1024))
+TEMP_DIR_ORPHAN_AGE = float(os.environ.get("TEMP_DIR_ORPHAN_AGE", 900))
+TEMP_DIR_SWEEP_INTERVAL = float(os.environ.get("TEMP_DIR_SWEEP_INTERVAL", 60))
+
+temp_janitor = janitor.TempDirJanitor(
+    TEMP_DIR,
+    caches=[audio_store, transcription_store],
+    max_bytes=TEMP_DIR_MAX_BYTES,
+    min_free_bytes=TEMP_DIR_MIN_FREE_BYTES,
+    orphan_age=TEMP_DIR_ORPHAN_AGE,
+    interval=TEMP_DIR_SWEEP_INTERVAL
+)
+
+# Concurrent requests for the same video share one download and one
+# transcription; waiters give up together after SINGLEFLIGHT_TIMEOUT seconds
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_TIMEOUT", 1800))
+
+# Streaming /transcribe responses (SSE or NDJSON) send a keepalive after
+# this many seconds without events, so proxies don't close idle connections
+STREAM_KEEPALIVE_SECONDS = float(os.environ.get("STREAM_KEEPALIVE_SECONDS", 15))
+
+# Batch transcription (/transcribe/batch): audio is downloaded into the audio
+# cache by BATCH_DOWNLOAD_CONCURRENCY threads per worker while the job pool
+# transcribes what has already arrived. Each batch keeps at most
+# BATCH_PREFETCH videos downloading or waiting for inference.
+BATCH_MAX_URLS = int(os.environ.get("BATCH_MAX_URLS", 500))
+BATCH_DOWNLOAD_CONCURRENCY = int(os.environ.get("BATCH_DOWNLOAD_CONCURRENCY", 4))
+BATCH_PREFETCH = max(int(os.environ.get("BATCH_PREFETCH", 8)), BATCH_DOWNLOAD_CONCURRENCY)
+
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="transcribe-job")
+batch_download_executor = ThreadPoolExecutor(max_workers=BATCH_DOWNLOAD_CONCURRENCY, thread_name_prefix="batch-download")
+job_lock = threading.Lock()
+jobs_pending = 0
+
+# Default Whisper model, used when a request doesn't choose one
 model_size = os.environ.get("WHISPER_MODEL", "base")
-logger.info(f"Loading Whisper model: {model_size}")
 
-# Check if CUDA is available for GPU acceleration
-device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info(f"Using device: {device}")
+# Models requests may choose with the "model" field. They are loaded on first
+# use; when their total size would exceed MODEL_MEMORY_BUDGET_MB the least
+# recently used idle models are unloaded (0 disables the budget).
+WHISPER_MODELS = [name.strip() for name in os.environ.get("WHISPER_MODELS", "tiny,base,small").split(",") if name.strip()]
+if model_size not in WHISPER_MODELS:
+    WHISPER_MODELS.insert(0, model_size)
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get("MODEL_MEMORY_BUDGET_MB", 2048))
+
+# INT8 dynamic quantization of the models' Linear layers (CPU only): faster
+# and smaller, slightly less accurate. Requests can override the default
+# with the "quantize" field; see compare_quantization.py to measure the trade-off.
+WHISPER_QUANTIZE = os.environ.get("WHISPER_QUANTIZE", "0") == "1"
+
+# Transcription engine (see engines.py): "whisper" (openai-whisper on torch),
+# "faster-whisper" (CTranslate2) or "onnx" (ONNX Runtime). Requests can pick
+# one of TRANSCRIPTION_ENGINES with the "engine" field; see
+# benchmark_engines.py to compare them on local audio.
+TRANSCRIPTION_ENGINE = os.environ.get("TRANSCRIPTION_ENGINE", "whisper")
+engines.get_engine(TRANSCRIPTION_ENGINE)
+TRANSCRIPTION_ENGINES = [name.strip() for name in os.environ.get("TRANSCRIPTION_ENGINES", ",".join(engines.ENGINES)).split(",") if name.strip()]
+if TRANSCRIPTION_ENGINE not in TRANSCRIPTION_ENGINES:
+    TRANSCRIPTION_ENGINES.insert(0, TRANSCRIPTION_ENGINE)
+
+model_registry = inference.ModelRegistry(
+    WHISPER_MODELS,
+    int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024),
+    batch_size=INFERENCE_BATCH_SIZE,
+    batch_wait=INFERENCE_BATCH_WAIT_MS / 1000
+)
+
+# Background startup: the server accepts requests right away while the
+# heavy imports and the default model load run in the background. /ready
+# reports "ready" once the default model is loaded.
+#
+# Preload mode (gunicorn.conf.py sets preload_app from the same variable)
+# instead loads the default model in the gunicorn master before it forks
+# the workers, so they share one copy of the weights copy-on-write.
+PRELOAD_MODEL = os.environ.get("PRELOAD_MODEL", "0") == "1"
+
+# CPU runtime of each worker (see cpu_runtime.py). The available CPUs (cgroup
+# quota and affinity mask) are split between the WORKER_COUNT workers;
+# gunicorn.conf.py sets WORKER_COUNT and each worker's WORKER_SLOT. 0 means
+# automatic for the thread counts. CPU_AFFINITY=1 pins each worker to its
+# own cores.
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", 0))
+TORCH_INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", 0))
+CPU_AFFINITY = os.environ.get("CPU_AFFINITY", "0") == "1"
+STARTUP_PHASES = ["import_torch", "import_whisper", "load_model", "import_yt_dlp"]
+startup_state = {"status": "starting", "phase": None, "phase_started": None, "error": None}
+startup_lock = threading.Lock()
+device = None
+
+@contextmanager
+def startup_phase(name):
+    """Record the duration of one startup phase in startup_timings."""
+    with startup_lock:
+        startup_state["phase"] = name
+        startup_state["phase_started"] = time.monotonic()
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        with startup_lock:
+            startup_timings[name] = round(time.monotonic() - started, 3)
+
+def load_inference_stack():
+    """Import the inference stack and load the default model (startup thread or preload)."""
+    global device
+    try:
+        with startup_phase("import_torch"):
+            import torch
+            device = inference.default_device()
+        logger.info(f"Using device: {device}")
+        
+        if PRELOAD_MODEL:
+            # Keep torch single-threaded in the gunicorn master: its OpenMP
+            # thread pool doesn't survive fork(), the workers set up their own
+            torch.set_num_threads(1)
+        else:
+            configure_cpu_runtime()
+        
+        with startup_phase("import_whisper"):
+            import whisper
+        
+        with startup_phase("load_model"):
+            if PRELOAD_MODEL and not engines.get_engine(TRANSCRIPTION_ENGINE).fork_safe:
+                # Its runtime's threads don't survive fork(): each worker
+                # loads its own copy instead, see init_worker()
+                logger.info(f"The {TRANSCRIPTION_ENGINE} engine can't be shared across workers; loading the model in each worker")
+            else:
+                load_default_model()
+    except Exception as e:
+        logger.error(f"Error loading Whisper model: {str(e)}", exc_info=True)
+        with startup_lock:
+            startup_state["status"] = "failed"
+            startup_state["phase"] = None
+            startup_state["error"] = str(e)
+        return
+    
+    with startup_lock:
+        startup_state["status"] = "ready"
+    
+    # Not needed for readiness, but keeps the first download from paying for it
+    try:
+        with startup_phase("import_yt_dlp"):
+            import yt_dlp
+    except ImportError as e:
+        logger.warning(f"Could not import yt_dlp: {str(e)}")
+    
+    with startup_lock:
+        startup_state["phase"] = None
+        startup_timings["total"] = round(time.monotonic() - startup_started, 3)
+    logger.info(f"Startup complete: {dict(startup_timings)}")
+
+def load_default_model():
+    """Load the default model on the default engine into the registry."""
+    engine = engines.get_engine(TRANSCRIPTION_ENGINE)
+    with model_registry.use(model_size, WHISPER_QUANTIZE and engine.can_quantize(device), TRANSCRIPTION_ENGINE):
+        pass
+
+# The CPU runtime plan applied to this worker, see configure_cpu_runtime()
+cpu_runtime_config = {}
+
+def configure_cpu_runtime():
+    """Set this worker's torch thread counts and, optionally, its cores."""
+    workers = int(os.environ.get("WORKER_COUNT", 1))
+    slot = int(os.environ.get("WORKER_SLOT", 0))
+    config = cpu_runtime.plan(workers, slot, TORCH_THREADS, TORCH_INTEROP_THREADS, CPU_AFFINITY)
+    warnings = cpu_runtime.apply(config)
+    for warning in warnings:
+        logger.warning(f"CPU runtime: {warning}")
+    
+    cpu_runtime_config.clear()
+    cpu_runtime_config.update(config, workers=workers, slot=slot, warnings=warnings)
+    # Engines with their own thread pools get the same share of the CPUs
+    model_registry.threads = config["threads"]
+    logger.info(f"Worker {slot + 1}/{workers}: {config['threads']} torch thread(s), cores {config['cpus'] or 'unpinned'}")
+
+def init_worker():
+    """Per-worker setup after a fork from a preloaded master (gunicorn post_fork hook)."""
+    configure_cpu_runtime()
+    temp_janitor.start()
+    if not engines.get_engine(TRANSCRIPTION_ENGINE).fork_safe:
+        load_default_model()
+
+def process_memory(pid="self"):
+    """
+    Memory of a process from /proc/<pid>/smaps_rollup, in MB.
+    
+    pss_mb splits shared pages between the processes sharing them, so the
+    PSS of the master and the workers adds up to the real total.
+    
+    Returns:
+        A dict of memory figures, or None when unavailable (e.g. off Linux)
+    """
+    fields = {
+        "Rss": "rss_mb",
+        "Pss": "pss_mb",
+        "Shared_Clean": "shared_clean_mb",
+        "Shared_Dirty": "shared_dirty_mb",
+        "Private_Clean": "private_clean_mb",
+        "Private_Dirty": "private_dirty_mb",
+        "Swap": "swap_mb"
+    }
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+    return memory
+
+def sibling_worker_pids():
+    """PIDs of the other gunicorn workers: processes with our parent and command line."""
+    parent = os.getppid()
+    try:
+        with open("/proc/self/cmdline", "rb") as f:
+            cmdline = f.read()
+        pids = []
+        for name in os.listdir("/proc"):
+            if not name.isdigit() or int(name) == os.getpid():
+                continue
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    # The command name may contain spaces, so split after it
+                    ppid = int(f.read().rpartition(")")[2].split()[1])
+                if ppid != parent:
+                    continue
+                with open(f"/proc/{name}/cmdline", "rb") as f:
+                    if f.read() == cmdline:
+                        pids.append(int(name))
+            except (OSError, ValueError, IndexError):
+                continue
+        return sorted(pids)
+    except OSError:
+        return []
+
+def memory_stats():
+    """Memory of this worker, its siblings and the master, for /stats."""
+    workers = {str(os.getpid()): process_memory()}
+    for pid in sibling_worker_pids():
+        workers[str(pid)] = process_memory(pid)
+    master = process_memory(os.getppid()) if len(workers) > 1 or PRELOAD_MODEL else None
+    
+    total_pss = sum(memory["pss_mb"] for memory in list(workers.values()) + [master] if memory and "pss_mb" in memory)
+    return {
+        "preloaded": PRELOAD_MODEL,
+        "worker": workers[str(os.getpid())],
+        "workers": workers,
+        "master": master,
+        "total_pss_mb": round(total_pss, 1)
+    }
+
+def get_device():
+    """The inference device, detecting it if the startup thread hasn't yet."""
+    global device
+    if device is None:
+        device = inference.default_device()
+    return device
+
+@app.route('/')
+def index():
+    """
+    Render the web interface.
+    """
+    return render_template('index.html')
+
+@app.route('/health')
+def health_check():
+    """
+    Health check endpoint (liveness). Answers as soon as the server is up;
+    see /ready for readiness.
+    """
+    return jsonify({
+        "status": "ok",
+        "ready": startup_state["status"] == "ready",
+        "version": "1.0.0",
+        "whisper_model": model_size,
+        "whisper_models": WHISPER_MODELS,
+        "transcription_engine": TRANSCRIPTION_ENGINE,
+        "transcription_engines": {name: available for name, available in engines.status().items() if name in TRANSCRIPTION_ENGINES},
+        "hostname": os.environ.get("HOSTNAME", "unknown")
+    })
+
+@app.route('/ready')
+def readiness_check():
+    """
+    Readiness endpoint: 200 once the default model is loaded, 503 before.
+    
+    While starting, reports the current startup phase and the fraction of
+    phases completed, plus the per-phase timings recorded so far.
+    """
+    with startup_lock:
+        state = dict(startup_state)
+        timings = dict(startup_timings)
+    
+    done = sum(1 for phase in STARTUP_PHASES if phase in timings)
+    body = {
+        "status": state["status"],
+        "whisper_model": model_size,
+        "progress": round(done / len(STARTUP_PHASES), 2),
+        "startup_timings": timings
+    }
+    if state["phase"]:
+        body["phase"] = state["phase"]
+        body["phase_seconds"] = round(time.monotonic() - state["phase_started"], 1)
+    if state["error"]:
+        body["error"] = state["error"]
+    
+    return jsonify(body), 200 if state["status"] == "ready" else 503
+
+@app.route('/stats')
+def stats():
+    """
+    Cache and runtime statistics for this worker process.
+    """
+    with audio_cache_lock:
+        audio_cache = dict(audio_cache_stats)
+    audio_cache["enabled"] = AUDIO_CACHE_ENABLED
+    audio_cache["storage"] = audio_store.stats()
+    
+    with transcription_cache_lock:
+        transcription_cache = dict(transcription_cache_stats)
+    transcription_cache["enabled"] = TRANSCRIPTION_CACHE_ENABLED
+    transcription_cache["storage"] = transcription_store.stats()
+    
+    with download_stream_lock:
+        downloads = dict(download_stream_stats)
+    downloads["streaming"] = DOWNLOAD_STREAMING
+    
+    return jsonify({
+        "pid": os.getpid(),
+        "audio_cache": audio_cache,
+        "transcription_cache": transcription_cache,
+        "jobs": {
+            "workers": JOB_WORKERS,
+            "pending": jobs_pending,
+            "max_queued": JOB_MAX_QUEUED
+        },
+        "yt_dlp_pool": yt_dlp_pool.stats(),
+        "downloads": downloads,
+        "disk": temp_janitor.stats(),
+        "video_info_cache": dict(video_info_stats, entries=len(video_info_cache), ttl=VIDEO_INFO_TTL),
+        "models": model_registry.stats(),
+        "memory": memory_stats(),
+        "cpu": dict(cpu_runtime.scheduling_stats(), runtime=cpu_runtime_config),
+        "coalescing": {
+            "downloads": download_flights.stats(),
+            "transcriptions": transcription_flights.stats()
+        }
+    })
+
+@app.route('/transcribe', methods=['POST'])
+def transcribe_video():
+    """
+    Endpoint to transcribe a YouTube video.
+    
+    This is a synchronous wrapper around the job queue: the request waits
+    for its job to finish and returns the result directly.
+    
+    Expected JSON payload:
+    {
+        "url": "https://www.youtube.com/watch?v=VIDEO_ID",
+        "model": "small",           (optional, one of WHISPER_MODELS)
+        "engine": "faster-whisper", (optional, one of TRANSCRIPTION_ENGINES)
+        "language": "en",           (optional, detected when omitted)
+        "task": "transcribe",       (optional, "transcribe" or "translate")
+        "vad": true,                (optional, transcribe only speech regions)
+        "quantize": false,          (optional, INT8 weights)
+        "stream": "sse"             (optional, "sse" or "ndjson", see stream_transcription)
+    }
+    
+    Streaming can also be requested with an Accept header of
+    text/event-stream or application/x-ndjson.
+    """
+    data = request.get_json()
+    
+    if not data or 'url' not in data:
+        return jsonify({"error": "URL is required"}), 400
+    
+    youtube_url = data['url']
+    logger.info(f"Transcription request for URL: {youtube_url}")
+    
+    try:
+        decode_options = get_decode_options(data)
+        stream = get_stream_format(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if stream:
+        try:
+            return stream_transcription(youtube_url, decode_options, stream)
+        except JobQueueFull as e:
+            return jsonify({"error": str(e)}), 503
+    
+    # Serve repeat requests straight from the result cache
+    cached = lookup_cached_transcription(youtube_url, decode_options)
+    if cached is not None:
+        response = jsonify(cached)
+        response.headers["X-Cache"] = "HIT"
+        return response
+    
+    try:
+        job_id, future = submit_transcription_job(youtube_url, decode_options)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    
+    try:
+        transcription = future.result()
+    except Exception as e:
+        logger.error(f"Error transcribing video: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    
+    response = jsonify(transcription)
+    response.headers["X-Cache"] = "MISS"
+    response.headers["X-Job-Id"] = job_id
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Endpoint to start an asynchronous transcription job.
+    
+    Accepts the same JSON payload as /transcribe and returns 202 with a job
+    ID right away. Poll GET /jobs/<job_id> for status, progress and result.
+    """
+    data = request.get_json()
+    
+    if not data or 'url' not in data:
+        return jsonify({"error": "URL is required"}), 400
+    
+    youtube_url = data['url']
+    logger.info(f"Transcription job request for URL: {youtube_url}")
+    
+    try:
+        decode_options = get_decode_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cached = lookup_cached_transcription(youtube_url, decode_options)
+    try:
+        if cached is not None:
+            job_id = create_completed_job(youtube_url, cached)
+        else:
+            job_id, _ = submit_transcription_job(youtube_url, decode_options)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    
+    status_url = f"/jobs/{job_id}"
+    response = jsonify({
+        "job_id": job_id,
+        "status": "completed" if cached is not None else "queued",
+        "status_url": status_url
+    })
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+@app.route('/transcribe/batch', methods=['POST'])
+def transcribe_batch():
+    """
+    Endpoint to transcribe many YouTube videos in one request.
+    
+    Expected JSON payload: the /transcribe options (model, engine, language,
+    task, vad, quantize) applied to every video, with a list of URLs:
+    {
+        "urls": ["https://www.youtube.com/watch?v=VIDEO_ID", ...],
+        "stream": "ndjson"          (optional, "ndjson" or "sse", see stream_batch)
+    }
+    
+    URLs of the same video are transcribed once. Without streaming, returns
+    202 with a batch job ID right away: GET /jobs/<batch_id> reports the
+    status of each video and the job holding its result.
+    """
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get("urls"), list) or not data["urls"]:
+        return jsonify({"error": "urls must be a non-empty list of URLs"}), 400
+    urls = data["urls"]
+    if not all(isinstance(url, str) and url for url in urls):
+        return jsonify({"error": "urls must be a non-empty list of URLs"}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({"error": f"A batch can have at most {BATCH_MAX_URLS} URLs"}), 400
+    
+    try:
+        decode_options = get_decode_options(data)
+        stream = get_stream_format(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    logger.info(f"Batch transcription request for {len(urls)} URL(s)")
+    if stream:
+        return stream_batch(urls, decode_options, stream)
+    
+    batch = start_batch(urls, decode_options)
+    status_url = f"/jobs/{batch['id']}"
+    response = jsonify({
+        "batch_id": batch["id"],
+        "status": "queued",
+        "total": len(urls),
+        "unique": len(batch["items"]),
+        "status_url": status_url
+    })
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Endpoint to get the status, progress and result of a transcription job.
+    """
+    job = read_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/info', methods=['GET'])
+def video_info():
+    """
+    Endpoint to get video metadata without downloading anything.
+    
+    Expected query parameters:
+    url: The YouTube video URL
+    """
+    youtube_url = request.args.get('url')
+    
+    if not youtube_url:
+        return jsonify({"error": "URL is required"}), 400
+    
+    logger.info(f"Info request for URL: {youtube_url}")
+    
+    try:
+        info, cache_hit = get_video_info(youtube_url)
+    except Exception as e:
+        logger.error(f"Error getting video info: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    
+    audio_formats = [
+        {
+            "format_id": fmt.get("format_id"),
+            "ext": fmt.get("ext"),
+            "acodec": fmt.get("acodec"),
+            "abr": fmt.get("abr"),
+            "asr": fmt.get("asr"),
+            "filesize": fmt.get("filesize") or fmt.get("filesize_approx"),
+            "protocol": fmt.get("protocol")
+        }
+        for fmt in info.get("formats") or []
+        if fmt.get("vcodec") == "none" and fmt.get("acodec") not in (None, "none")
+    ]
+    
+    response = jsonify({
+        "video_id": info.get("id"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "uploader": info.get("uploader"),
+        "thumbnail": info.get("thumbnail"),
+        "is_live": info.get("is_live"),
+        "audio_formats": audio_formats
+    })
+    response.headers["X-Cache"] = "HIT" if cache_hit else "MISS"
+    return response
+
+@app.route('/admin/download-methods', methods=['GET'])
+def download_methods_status():
+    """
+    Endpoint to inspect the download method ranking and circuit breakers of
+    this worker process.
+    """
+    return jsonify({
+        "pid": os.getpid(),
+        "order": [method.__name__ for method in method_health.order(download_methods(), reserve_probes=False)],
+        "methods": method_health.snapshot()
+    })
+
+@app.route('/transcribe/cache/<video_id>', methods=['DELETE'])
+def invalidate_transcription(video_id):
+    """
+    Endpoint to invalidate cached transcriptions of a video.
+    
+    Without query parameters every cached transcription of the video is
+    removed. With any of the optional query parameters (model, engine,
+    quantize, language, task, vad) only the single matching entry is removed.
+    """
+    if not is_valid_video_id(video_id):
+        return jsonify({"error": "Invalid video ID"}), 400
+    
+    if any(name in request.args for name in ("model", "engine", "quantize", "language", "task", "vad")):
+        try:
+            decode_options = get_decode_options(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        keys = [transcription_cache_key(video_id, decode_options)]
+    else:
+        keys = None
+    
+    removed = invalidate_cached_transcriptions(video_id, keys)
+    return jsonify({"video_id": video_id, "removed": removed})
+
+@app.route('/downloads', methods=['GET'])
+def download_mp3():
+    """
+    Endpoint to download a YouTube video as MP3.
+    
+    Expected query parameters:
+    url: The YouTube video URL
+    stream: Optional, "1" or "0" to override DOWNLOAD_STREAMING
+    
+    Unless the MP3 is already cached, a streaming download starts sending
+    the MP3 while the audio is still downloading (see stream_mp3).
+    """
+    youtube_url = request.args.get('url')
+    
+    if not youtube_url:
+        return jsonify({"error": "URL is required"}), 400
+    
+    logger.info(f"Download request for URL: {youtube_url}")
+    
+    video_id = extract_video_id(youtube_url)
+    filename = f"youtube_audio_{video_id or youtube_url.split('v=')[-1].split('&')[0]}.mp3"
+    
+    # Cached MP3s are stable per video: serve them with validators and ranges
+    if AUDIO_CACHE_ENABLED and video_id and os.path.exists(audio_store.path(audio_cache_name(video_id))):
+        pin = get_cached_audio(video_id)
+        if pin:
+            # The file can't be evicted until it has been sent
+            try:
+                return send_audio_file(pin.path, filename, cacheable=True, on_close=pin.release)
+            except OSError:
+                pass  # Removed in the meantime: download it again
+    
+    if parse_flag(request.args.get("stream"), DOWNLOAD_STREAMING):
+        try:
+            chunks = stream_mp3(youtube_url)
+        except DownloadInProgress as e:
+            # Wait for that download below and send the cached file
+            logger.info(str(e))
+        except Exception as e:
+            logger.warning(f"Streaming download failed, falling back to a full download: {str(e)}")
+            with download_stream_lock:
+                download_stream_stats["fallbacks"] += 1
+        else:
+            return Response(chunks, mimetype="audio/mpeg", headers={
+                "Content-Disposition": f"attachment; filename={filename}",
+                "Cache-Control": "no-cache, no-store, must-revalidate",
+                "Accept-Ranges": "none",
+                "X-Accel-Buffering": "no"
+            })
+    
+    # Create a unique temporary directory for this request
+    temp_dir = janitor.create_work_dir(TEMP_DIR)
+    pins = []
+    
+    def cleanup():
+        for pin in pins:
+            pin.release()
+        janitor.remove_work_dir(temp_dir)
+    
+    try:
+        # Download audio from YouTube
+        audio_path = download_audio(youtube_url, temp_dir, pins=pins)
+    except Exception as e:
+        cleanup()
+        logger.error(f"Error downloading audio: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    
+    # The file is still being sent, from the cache or (if it couldn't be
+    # cached) the request directory: clean up once the response is finished
+    # or aborted
+    try:
+        return send_audio_file(audio_path, filename, cacheable=not is_path_inside(audio_path, temp_dir), on_close=cleanup)
+    except OSError as e:
+        logger.error(f"Error sending audio: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+def send_audio_file(path, download_name, cacheable, on_close=None):
+    """
+    Send an MP3 file with conditional GET and single byte-range support.
+    
+    A strong ETag (from the file's inode, size and modification time) and
+    Last-Modified are sent with every response. If-None-Match and
+    If-Modified-Since get a 304, Range a 206 (or 416), and If-Range falls
+    back to the full file when the validator no longer matches. Bodies go
+    through the server's wsgi.file_wrapper, which gunicorn sends with
+    sendfile(); ranges just start at an offset into the file.
+    
+    Args:
+        path: The MP3 file
+        download_name: File name for Content-Disposition
+        cacheable: Whether clients and CDNs may store the response for
+            DOWNLOAD_MAX_AGE seconds (files from the audio cache); other
+            files are not stable and are sent with no-store
+        on_close: Optional callable run once the body has been sent, when
+            the client disconnects, or right away if there is no body or
+            the file can't be sent. It is run by the body's close(), since
+            with direct_passthrough Response.close and its call_on_close
+            callbacks are bypassed.
+    
+    Raises:
+        OSError: If the file can't be opened
+    """
+    try:
+        f = ResponseFile(open(path, "rb"), on_close)
+    except OSError:
+        if on_close:
+            on_close()
+        raise
+    try:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        etag = hashlib.sha1(f"{st.st_ino}:{size}:{st.st_mtime_ns}".encode("utf-8")).hexdigest()[:20]
+        
+        response = Response(mimetype="audio/mpeg")
+        response.set_etag(etag)
+        response.last_modified = int(st.st_mtime)
+        response.headers["Accept-Ranges"] = "bytes"
+        response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+        if cacheable:
+            response.cache_control.public = True
+            response.cache_control.max_age = DOWNLOAD_MAX_AGE
+        else:
+            response.cache_control.no_store = True
+        
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = request.if_modified_since is not None and int(st.st_mtime) <= request.if_modified_since.timestamp()
+        if not_modified:
+            f.close()
+            response.status_code = 304
+            with download_stream_lock:
+                download_stream_stats["not_modified"] += 1
+            return response
+        
+        start, stop = 0, size
+        byte_range = request.range
+        if byte_range is not None and byte_range.units == "bytes" and len(byte_range.ranges) == 1:
+            # If-Range: only send the range if the client's copy is current
+            if_range = request.if_range
+            if if_range.etag is not None:
+                range_valid = if_range.etag == etag
+            elif if_range.date is not None:
+                range_valid = int(st.st_mtime) == int(if_range.date.timestamp())
+            else:
+                range_valid = True
+            
+            if range_valid:
+                bounds = byte_range.range_for_length(size)
+                if bounds is None:
+                    f.close()
+                    response.status_code = 416
+                    response.headers["Content-Range"] = f"bytes */{size}"
+                    return response
+                start, stop = bounds
+                response.status_code = 206
+                response.content_range = ContentRange("bytes", start, stop, size)
+                with download_stream_lock:
+                    download_stream_stats["ranges"] += 1
+        
+        f.seek(start)
+        response.content_length = stop - start
+        file_wrapper = request.environ.get("wsgi.file_wrapper")
+        # gunicorn sends Content-Length bytes from the current offset; other
+        # servers may read their file wrapper to the end of the file
+        if file_wrapper and (stop == size or request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn")):
+            response.response = file_wrapper(f, 256 * 1024)
+        else:
+            response.response = ClosingIterator(read_file_range(f, stop - start), f.close)
+        response.direct_passthrough = True
+        return response
+    except Exception:
+        f.close()
+        raise
+
+class ResponseFile:
+    """
+    A file sent as a response body that runs a callback when it is closed.
+    
+    Servers close the file they send through wsgi.file_wrapper when the
+    response is finished or aborted (gunicorn does so after sendfile()).
+    """
+    
+    def __init__(self, f, on_close=None):
+        self._file = f
+        self._on_close = on_close
+    
+    def read(self, size=-1):
+        return self._file.read(size)
+    
+    def fileno(self):
+        return self._file.fileno()
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+    
+    def tell(self):
+        return self._file.tell()
+    
+    def close(self):
+        on_close, self._on_close = self._on_close, None
+        try:
+            self._file.close()
+        finally:
+            if on_close:
+                on_close()
+
+def read_file_range(f, length, block_size=256 * 1024):
+    """
+    Yield length bytes of an open file from its current offset, then close
+    it. Wrap it in a ClosingIterator that closes the file as well: a
+    generator closed before its first read never runs its finally clause.
+    """
+    try:
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+def extract_video_id(youtube_url):
+    """
+    Extract the canonical video ID from a YouTube URL.
+    
+    Returns:
+        The video ID, or None if it can't be parsed or isn't a valid ID
+    """
+    video_id = None
+    if "v=" in youtube_url:
+        video_id = youtube_url.split("v=")[1].split("&")[0]
+    elif "youtu.be/" in youtube_url:
+        video_id = youtube_url.split("youtu.be/")[1].split("?")[0]
+    
+    if video_id and is_valid_video_id(video_id):
+        return video_id
+    return None
+
+def is_valid_video_id(video_id):
+    """Video IDs are also used as file names, so only accept the YouTube alphabet."""
+    return re.fullmatch(r"[A-Za-z0-9_-]{6,64}", video_id) is not None
+
+def is_path_inside(path, directory):
+    """Check whether path is located inside directory."""
+    directory = os.path.abspath(directory)
+    return os.path.commonpath([os.path.abspath(path), directory]) == directory
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into a single execution.
+    
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait for and share its result or exception.
+    The timeout is shared too: it is measured from the leader's start, so all
+    waiters of a flight give up at the same moment with a TimeoutError, and
+    the next caller starts a new flight.
+    """
+    
+    class _Call:
+        def __init__(self, deadline):
+            self.deadline = deadline
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+    
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "followers": 0, "timeouts": 0, "failures": 0}
+    
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() for key unless a call for key is already in flight.
+        
+        Returns:
+            The result of the (possibly shared) call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                deadline = time.monotonic() + timeout if timeout is not None else None
+                call = self._calls[key] = self._Call(deadline)
+                self._stats["leaders"] += 1
+            else:
+                call.waiters += 1
+                self._stats["followers"] += 1
+        
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+        else:
+            logger.info(f"Waiting for in-flight {self.name} of {key}")
+            remaining = None
+            if call.deadline is not None:
+                remaining = max(0.0, call.deadline - time.monotonic())
+            if not call.done.wait(remaining):
+                with self._lock:
+                    # Detach the expired flight so the next caller starts over
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                    self._stats["timeouts"] += 1
+                raise TimeoutError(f"{self.name} for {key} timed out after {timeout:.0f}s")
+        
+        if call.error is not None:
+            if leader:
+                with self._lock:
+                    self._stats["failures"] += 1
+            raise call.error
+        return call.result
+    
+    def stats(self):
+        """Counters and the number of keys currently in flight."""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+download_flights = SingleFlight("audio download")
+transcription_flights = SingleFlight("transcription")
+
+@contextmanager
+def file_lock(path, timeout=None):
+    """
+    Hold an exclusive advisory lock on path, shared across worker processes.
+    
+    The lock file is removed when the lock is released, so per-key locks
+    don't accumulate. A waiter that gets the lock on a file that has been
+    removed meanwhile retries on the current one.
+    
+    Raises:
+        TimeoutError: If the lock could not be acquired within timeout seconds
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        f = open(path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for lock {path}")
+            time.sleep(0.5)
+            continue
+        try:
+            current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            break
+        f.close()  # Released and removed by the previous holder
+    try:
+        yield
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        f.close()
+
+def audio_cache_name(video_id, transcode=True):
+    """
+    Name of the cached audio of a video ID in audio_store.
+    
+    Transcoded downloads are cached as MP3; untranscoded ones keep the
+    source container and codec (ffmpeg probes the content when decoding).
+    """
+    return f"{video_id}.mp3" if transcode else f"{video_id}.source"
+
+def audio_lock_path(video_id, transcode=True):
+    """Lock file held across worker processes while a video's audio variant is downloaded."""
+    return os.path.join(AUDIO_CACHE_DIR, f".{audio_cache_name(video_id, transcode)}.lock")
+
+def get_cached_audio(video_id, transcode=True):
+    """
+    Look up a video in the audio cache.
+    
+    Without transcode either cached variant will do, since both can be
+    decoded for Whisper; the source stream is preferred.
+    
+    Returns:
+        A storage.Pin on the cached audio file, which keeps it from being
+        evicted until released, or None on a cache miss
+    """
+    if transcode:
+        names = [audio_cache_name(video_id)]
+    else:
+        names = [audio_cache_name(video_id, transcode=False), audio_cache_name(video_id)]
+    
+    for name in names:
+        pin = audio_store.pin(name)
+        if pin:
+            with audio_cache_lock:
+                audio_cache_stats["hits"] += 1
+            logger.info(f"Audio cache hit for video ID: {video_id}")
+            return pin
+    
+    with audio_cache_lock:
+        audio_cache_stats["misses"] += 1
+    logger.info(f"Audio cache miss for video ID: {video_id}")
+    return None
+
+def publish_cached_audio(video_id, audio_path, transcode=True):
+    """
+    Move a downloaded audio file into the audio cache (atomically, see
+    storage.Storage.put), evicting old entries when over budget.
+    
+    Returns:
+        The path to the cached audio file
+    """
+    final_path = audio_store.put(audio_cache_name(video_id, transcode), audio_path)
+    with audio_cache_lock:
+        audio_cache_stats["stores"] += 1
+    logger.info(f"Stored audio for video ID {video_id} in cache: {final_path}")
+    return final_path
+
+# Options that control the pipeline around Whisper rather than its decoding
+PIPELINE_OPTIONS = ("model", "engine", "quantize", "vad")
+
+def parse_flag(value, default=False):
+    """Parse a boolean from JSON (true/false) or a query string ("1", "true", ...)."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def get_decode_options(data):
+    """
+    Build the transcription options for a request.
+    
+    Args:
+        data: Mapping with the optional "model", "engine", "quantize",
+            "language", "task" and "vad" fields
+    
+    Returns:
+        Keyword arguments for model.transcribe plus the pipeline flags in
+        PIPELINE_OPTIONS (see whisper_options)
+    """
+    task = data.get("task") or "transcribe"
+    if task not in ("transcribe", "translate"):
+        raise ValueError("task must be 'transcribe' or 'translate'")
+    
+    model_name = data.get("model") or model_size
+    if model_name not in WHISPER_MODELS:
+        raise ValueError(f"model must be one of: {', '.join(WHISPER_MODELS)}")
+    
+    engine_name = data.get("engine") or TRANSCRIPTION_ENGINE
+    if engine_name not in TRANSCRIPTION_ENGINES:
+        raise ValueError(f"engine must be one of: {', '.join(TRANSCRIPTION_ENGINES)}")
+    engine = engines.get_engine(engine_name)
+    if not engine.available():
+        raise ValueError(f"engine {engine_name} is not installed ({engine.install_hint})")
+    
+    quantize = parse_flag(data.get("quantize"), WHISPER_QUANTIZE and engine.can_quantize(get_device()))
+    if quantize and not engine.can_quantize(get_device()):
+        raise ValueError(f"quantize is not supported by the {engine_name} engine on {get_device()}")
+    
+    return {
+        "model": model_name,
+        "engine": engine_name,
+        "quantize": quantize,
+        "fp16": False if get_device() == "cpu" else True,
+        "language": data.get("language") or None,
+        "task": task,
+        "vad": parse_flag(data.get("vad"), VAD_ENABLED)
+    }
+
+def whisper_options(decode_options):
+    """The subset of the transcription options that model.transcribe accepts."""
+    return {key: value for key, value in decode_options.items() if key not in PIPELINE_OPTIONS}
+
+STREAM_MIMETYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+def get_stream_format(data):
+    """
+    The streaming format a /transcribe request asks for.
+    
+    Args:
+        data: The request's JSON body; its optional "stream" field is "sse",
+            "ndjson" or a boolean (true picks the format from the Accept header)
+    
+    Returns:
+        "sse", "ndjson" or None for a regular JSON response
+    """
+    stream = data.get("stream")
+    if isinstance(stream, str) and stream in STREAM_MIMETYPES:
+        return stream
+    if stream is not None and not isinstance(stream, bool):
+        raise ValueError("stream must be 'sse', 'ndjson' or a boolean")
+    if stream is False:
+        return None
+    
+    # JSON wins ties, so "Accept: */*" keeps the regular response
+    best = request.accept_mimetypes.best_match(["application/json", *STREAM_MIMETYPES.values()])
+    for stream_format, mimetype in STREAM_MIMETYPES.items():
+        if best == mimetype:
+            return stream_format
+    return "ndjson" if stream else None
+
+def format_stream_event(stream_format, event, data=None):
+    """Serialize one event as an SSE message or an NDJSON line."""
+    data = data or {}
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+def stream_transcription(youtube_url, decode_options, stream_format):
+    """
+    Streaming /transcribe response.
+    
+    Events, in order:
+        job       {"job_id"} (not sent for cached results)
+        progress  {"stage", "progress"} while downloading, decoding and
+                  transcribing
+        segment   one per segment, as soon as its 30-second window is decoded
+        done      the regular response without "segments", plus "segment_count"
+        error     {"error"} instead of done if the transcription fails
+    
+    A keepalive (an SSE comment or a {"event": "keepalive"} line) is sent
+    after STREAM_KEEPALIVE_SECONDS without events. Segments of a result
+    shared with a concurrent request or found in the cache are all sent at
+    the end. The job keeps running if the client disconnects, and its result
+    is cached.
+    
+    Raises:
+        JobQueueFull: If the job queue is full
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    
+    def finish(transcription, sent):
+        for segment in transcription["segments"][sent:]:
+            yield format_stream_event(stream_format, "segment", segment)
+        summary = {key: value for key, value in transcription.items() if key != "segments"}
+        summary["segment_count"] = len(transcription["segments"])
+        yield format_stream_event(stream_format, "done", summary)
+    
+    cached = lookup_cached_transcription(youtube_url, decode_options)
+    if cached is not None:
+        headers["X-Cache"] = "HIT"
+        return Response(finish(cached, 0), mimetype=STREAM_MIMETYPES[stream_format], headers=headers)
+    
+    events = queue.Queue()
+    job_id, future = submit_transcription_job(
+        youtube_url, decode_options,
+        progress_callback=lambda stage, progress: events.put(("progress", {"stage": stage, "progress": progress})),
+        segment_callback=lambda segments: events.put(("segments", segments))
+    )
+    future.add_done_callback(lambda _: events.put(("done", None)))
+    
+    def generate():
+        yield format_stream_event(stream_format, "job", {"job_id": job_id})
+        sent = 0
+        while True:
+            try:
+                kind, data = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n" if stream_format == "sse" else format_stream_event(stream_format, "keepalive")
+                continue
+            
+            if kind == "progress":
+                yield format_stream_event(stream_format, "progress", data)
+            elif kind == "segments":
+                for segment in data:
+                    yield format_stream_event(stream_format, "segment", segment)
+                sent += len(data)
+            else:
+                try:
+                    transcription = future.result()
+                except Exception as e:
+                    logger.error(f"Error transcribing video: {str(e)}", exc_info=True)
+                    yield format_stream_event(stream_format, "error", {"error": str(e)})
+                else:
+                    yield from finish(transcription, sent)
+                return
+    
+    headers["X-Cache"] = "MISS"
+    headers["X-Job-Id"] = job_id
+    return Response(generate(), mimetype=STREAM_MIMETYPES[stream_format], headers=headers)
+
+def transcription_cache_key(video_id, decode_options):
+    """
+    Cache key for a transcription result.
+    
+    The video ID is kept as a prefix so all entries of a video can be found.
+    Results of batched inference, whose windows aren't conditioned on the
+    previous text, are kept apart from the others.
+    """
+    options = {key: value for key, value in decode_options.items() if key != "model"}
+    if uses_batched_inference(decode_options):
+        options["batched"] = True
+    digest = hashlib.sha1(
+        json.dumps([decode_options["model"], options], sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{video_id}-{digest}"
+
+def uses_batched_inference(decode_options):
+    """Whether this worker decodes a request's windows through an inference.InferenceBatcher."""
+    return INFERENCE_BATCH_SIZE > 1 and engines.get_engine(decode_options["engine"]).supports_batching
+
+def transcription_cache_name(cache_key):
+    """Name of the cached transcription result for a cache key in transcription_store."""
+    return f"{cache_key}.json"
+
+def get_cached_transcription(cache_key):
+    """
+    Look up a transcription result in the cache.
+    
+    Returns:
+        The cached {"transcription", "segments"} dict, or None on a cache miss
+    """
+    name = transcription_cache_name(cache_key)
+    try:
+        with open(transcription_store.path(name), encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        with transcription_cache_lock:
+            transcription_cache_stats["misses"] += 1
+        return None
+    
+    # Mark as used for eviction
+    transcription_store.touch(name)
+    with transcription_cache_lock:
+        transcription_cache_stats["hits"] += 1
+    logger.info(f"Transcription cache hit: {cache_key}")
+    return result
+
+def store_cached_transcription(cache_key, result):
+    """Atomically store a transcription result, evicting old entries when over budget."""
+    try:
+        transcription_store.write(transcription_cache_name(cache_key), json.dumps(result).encode("utf-8"))
+    except Exception as e:
+        logger.warning(f"Error storing transcription in cache: {str(e)}")
+        return
+    
+    with transcription_cache_lock:
+        transcription_cache_stats["stores"] += 1
+
+def invalidate_cached_transcriptions(video_id, cache_keys=None):
+    """
+    Remove cached transcriptions of a video.
+    
+    Args:
+        video_id: The YouTube video ID
+        cache_keys: Specific cache keys to remove, or None for all entries of the video
+    
+    Returns:
+        The number of removed entries
+    """
+    if cache_keys is None:
+        # Keys are "<video_id>-<16 hex digits>"; IDs may contain "-" themselves
+        pattern = re.compile(re.escape(video_id) + r"-[0-9a-f]{16}\.json")
+        names = [name for name in transcription_store.names() if pattern.fullmatch(name)]
+    else:
+        names = [transcription_cache_name(cache_key) for cache_key in cache_keys]
+    
+    removed = sum(1 for name in names if transcription_store.remove(name))
+    
+    with transcription_cache_lock:
+        transcription_cache_stats["invalidations"] += removed
+    logger.info(f"Invalidated {removed} cached transcription(s) for video ID: {video_id}")
+    return removed
+
+def lookup_cached_transcription(youtube_url, decode_options):
+    """
+    Look up a transcription of a URL in the result cache.
+    
+    Returns:
+        The cached {"transcription", "segments"} dict, or None
+    """
+    video_id = extract_video_id(youtube_url)
+    if not TRANSCRIPTION_CACHE_ENABLED or not video_id:
+        return None
+    return get_cached_transcription(transcription_cache_key(video_id, decode_options))
+
+def run_transcription(youtube_url, decode_options, progress_callback=None, segment_callback=None):
+    """
+    Transcribe a YouTube video, sharing the work with concurrent identical requests.
+    
+    Only one transcription per (video, model, decode options) runs at a time
+    across all worker processes; the others wait and reuse its result.
+    
+    Args:
+        youtube_url: The YouTube video URL
+        decode_options: Transcription options (see get_decode_options)
+        progress_callback: Optional callable(stage, progress) for status updates
+        segment_callback: Optional callable(segments) receiving segments as
+            they are decoded. Not called when the result comes from another
+            request's transcription or the cache.
+    
+    Returns:
+        The {"transcription", "segments"} dict
+    """
+    video_id = extract_video_id(youtube_url)
+    if video_id:
+        cache_key = transcription_cache_key(video_id, decode_options)
+    else:
+        cache_key = hashlib.sha1(json.dumps([youtube_url, decode_options], sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def transcribe_once():
+        if not (TRANSCRIPTION_CACHE_ENABLED and video_id):
+            return transcribe_uncached(youtube_url, decode_options, progress_callback, segment_callback)
+        
+        # Another worker process may be transcribing the same video; wait for
+        # it and reuse its cached result instead of running Whisper again
+        lock_path = os.path.join(TRANSCRIPTION_CACHE_DIR, f".{cache_key}.lock")
+        with file_lock(lock_path, SINGLEFLIGHT_TIMEOUT):
+            cached = get_cached_transcription(cache_key)
+            if cached is not None:
+                return cached
+            return transcribe_uncached(youtube_url, decode_options, progress_callback, segment_callback)
+    
+    return transcription_flights.do(cache_key, transcribe_once, SINGLEFLIGHT_TIMEOUT)
+
+def transcribe_uncached(youtube_url, decode_options, progress_callback=None, segment_callback=None):
+    """
+    Download and transcribe a YouTube video, storing the result in the cache.
+    
+    Returns:
+        The {"transcription", "segments"} dict
+    """
+    def report(stage, progress):
+        if progress_callback:
+            progress_callback(stage, progress)
+    
+    def on_segments(segments, progress):
+        # Segments are passed on in the original timeline; the result's own
+        # segments are remapped once the transcription is complete
+        if segment_callback and segments:
+            segments = copy.deepcopy(segments)
+            if timeline:
+                audio_processing.remap_segments(segments, timeline)
+            segment_callback(segments)
+        report("transcribing", round(0.5 + 0.5 * progress, 3))
+    
+    # Download and decode the audio from YouTube
+    report("downloading", 0.1)
+    audio = load_audio_for_transcription(youtube_url, progress_callback)
+    
+    # Skip silence and music, keeping a map back to the original timeline
+    vad = None
+    timeline = None
+    if decode_options.get("vad"):
+        started = time.monotonic()
+        regions = audio_processing.detect_speech(audio)
+        speech_audio, timeline = audio_processing.compress_speech(audio, regions)
+        vad = {
+            "total_seconds": round(len(audio) / SAMPLE_RATE, 3),
+            "speech_seconds": round(sum(end - start for start, end in regions) / SAMPLE_RATE, 3),
+            "skipped_fraction": round(1 - sum(end - start for start, end in regions) / max(len(audio), 1), 4),
+            "regions": len(regions)
+        }
+        logger.info(f"VAD kept {vad['speech_seconds']}s of {vad['total_seconds']}s in {time.monotonic() - started:.2f}s")
+        audio = speech_audio
+    
+    # Transcribe the audio using the Whisper model
+    report("transcribing", 0.5)
+    logger.info(f"Transcribing {len(audio) / SAMPLE_RATE:.1f}s of audio with model {decode_options['model']} ({decode_options['engine']}) for URL: {youtube_url}")
+    if len(audio) == 0:
+        result = {"text": "", "segments": []}
+    else:
+        with model_registry.use(decode_options["model"], decode_options["quantize"], decode_options["engine"]) as entry:
+            long_audio = LONG_AUDIO_WORKERS > 1 and len(audio) > LONG_AUDIO_THRESHOLD * SAMPLE_RATE
+            if long_audio and entry.engine.supports_long_audio:
+                result = transcribe_long_audio(entry.model, audio, decode_options)
+                on_segments(result["segments"], 1.0)
+            elif entry.batcher is not None:
+                result = inference.transcribe(entry.batcher, audio, **whisper_options(decode_options), segment_callback=on_segments)
+            else:
+                result = entry.engine.transcribe(entry.model, audio, **whisper_options(decode_options), segment_callback=on_segments)
+    
+    if timeline:
+        audio_processing.remap_segments(result["segments"], timeline)
+    
+    transcription = {
+        "transcription": result["text"],
+        "segments": result["segments"]
+    }
+    if vad is not None:
+        transcription["vad"] = vad
+    
+    video_id = extract_video_id(youtube_url)
+    if TRANSCRIPTION_CACHE_ENABLED and video_id:
+        store_cached_transcription(transcription_cache_key(video_id, decode_options), transcription)
+    
+    return transcription
+
+def get_long_audio_pool():
+    """
+    Process pool for long-audio chunks, created on first use.
+    
+    Worker processes are spawned rather than forked, so they don't inherit
+    this process's threads and torch state, and each loads its own model.
+    """
+    global long_audio_pool
+    with long_audio_pool_lock:
+        if long_audio_pool is None:
+            threads = max(1, cpu_runtime_config.get("threads", cpu_runtime.available_cpus()) // LONG_AUDIO_WORKERS)
+            logger.info(f"Starting {LONG_AUDIO_WORKERS} long-audio worker processes with {threads} thread(s) each")
+            long_audio_pool = ProcessPoolExecutor(
+                max_workers=LONG_AUDIO_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=audio_processing.init_chunk_worker,
+                initargs=(model_size, get_device(), threads, WHISPER_QUANTIZE and get_device() == "cpu")
+            )
+        return long_audio_pool
+
+def transcribe_long_audio(model, audio, decode_options):
+    """
+    Transcribe long audio as overlapping chunks in parallel worker processes.
+    
+    Args:
+        model: The loaded model, used to detect the language once
+        audio: 16 kHz mono float32 samples
+        decode_options: Transcription options (see get_decode_options)
+    
+    Returns:
+        A dict with "text", "segments" and "language", like model.transcribe
+    """
+    import whisper
+    
+    model_name = decode_options["model"]
+    quantize = decode_options["quantize"]
+    decode_options = whisper_options(decode_options)
+    if not decode_options.get("language"):
+        # Detect once so every chunk is decoded in the same language
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+        _, probs = model.detect_language(mel)
+        decode_options["language"] = max(probs, key=probs.get)
+    
+    chunks = audio_processing.find_chunks(audio, LONG_AUDIO_CHUNK_SECONDS, LONG_AUDIO_OVERLAP_SECONDS)
+    logger.info(f"Transcribing {len(chunks)} chunks in parallel (language: {decode_options['language']})")
+    
+    pool = get_long_audio_pool()
+    futures = [
+        pool.submit(audio_processing.transcribe_chunk, audio[chunk["start"]:chunk["end"]], decode_options, model_name, quantize)
+        for chunk in chunks
+    ]
+    results = [future.result() for future in futures]
+    
+    result = audio_processing.stitch_segments(chunks, results)
+    result["language"] = decode_options["language"]
+    return result
+
+class JobQueueFull(Exception):
+    """Raised when too many transcription jobs are waiting in this worker."""
+
+def job_path(job_id):
+    """Path of the state file of a job."""
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def write_job(job):
+    """Atomically write the state of a job to JOBS_DIR."""
+    path = job_path(job["id"])
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+def read_job(job_id):
+    """
+    Read the state of a job.
+    
+    Jobs left queued or running by a worker process that no longer exists
+    are reported as failed.
+    
+    Returns:
+        The job dict, or None if the job doesn't exist
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    
+    try:
+        with open(job_path(job_id), encoding="utf-8") as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if job["status"] in ("queued", "running") and job.get("hostname") == socket.gethostname():
+        try:
+            os.kill(job["pid"], 0)
+        except ProcessLookupError:
+            job.update(status="failed", error="Worker process exited before the job finished")
+        except PermissionError:
+            pass
+    
+    # Internal bookkeeping, not part of the API
+    job.pop("pid", None)
+    job.pop("hostname", None)
+    return job
+
+def new_job(youtube_url):
+    """Create the initial state of a job."""
+    return {
+        "id": str(uuid.uuid4()),
+        "url": youtube_url,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0.0,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+        "pid": os.getpid(),
+        "hostname": socket.gethostname()
+    }
+
+def create_completed_job(youtube_url, transcription):
+    """Record a job whose result was already available in the cache."""
+    job = new_job(youtube_url)
+    now = time.time()
+    job.update(status="completed", stage="done", progress=1.0, started_at=now,
+               finished_at=now, result=transcription)
+    write_job(job)
+    prune_jobs()
+    return job["id"]
+
+def submit_transcription_job(youtube_url, decode_options, progress_callback=None, segment_callback=None):
+    """
+    Queue a transcription on the job worker pool.
+    
+    The callbacks, if given, are called from the pool thread (see
+    run_transcription).
+    
+    Returns:
+        A (job_id, future) tuple; the future resolves to the transcription dict
+    """
+    global jobs_pending
+    
+    with job_lock:
+        if jobs_pending >= JOB_MAX_QUEUED:
+            raise JobQueueFull("Too many transcription jobs in progress, try again later")
+        jobs_pending += 1
+    
+    job = new_job(youtube_url)
+    try:
+        write_job(job)
+        future = job_executor.submit(execute_job, job, decode_options, progress_callback, segment_callback)
+    except Exception:
+        with job_lock:
+            jobs_pending -= 1
+        raise
+    
+    prune_jobs()
+    logger.info(f"Queued transcription job {job['id']} for URL: {youtube_url}")
+    return job["id"], future
+
+def execute_job(job, decode_options, progress_callback=None, segment_callback=None):
+    """Run a queued transcription job on a pool thread, recording its progress."""
+    global jobs_pending
+    
+    def update(**fields):
+        job.update(fields)
+        try:
+            write_job(job)
+        except Exception as e:
+            logger.warning(f"Error writing state of job {job['id']}: {str(e)}")
+    
+    def on_progress(stage, progress):
+        update(stage=stage, progress=progress)
+        if progress_callback:
+            progress_callback(stage, progress)
+    
+    try:
+        update(status="running", started_at=time.time())
+        transcription = run_transcription(job["url"], decode_options, on_progress, segment_callback)
+        update(status="completed", stage="done", progress=1.0, finished_at=time.time(), result=transcription)
+        return transcription
+    except Exception as e:
+        logger.error(f"Transcription job {job['id']} failed: {str(e)}", exc_info=True)
+        update(status="failed", finished_at=time.time(), error=str(e))
+        raise
+    finally:
+        with job_lock:
+            jobs_pending -= 1
+
+def prune_jobs():
+    """Remove finished jobs older than JOB_RETENTION_SECONDS."""
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for name in os.listdir(JOBS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            if os.path.getmtime(job_path(name[:-len(".json")])) >= cutoff:
+                continue
+            job = read_job(name[:-len(".json")])
+            if job and job["status"] in ("completed", "failed"):
+                os.remove(job_path(job["id"]))
+        except OSError:
+            continue
+
+def new_batch(urls):
+    """
+    Create the initial state of a batch job, with one item per distinct video.
+    
+    URLs are grouped by video ID (by the URL itself when there is none);
+    each item lists the indexes of the URLs it covers.
+    """
+    items = []
+    by_key = {}
+    for index, url in enumerate(urls):
+        video_id = extract_video_id(url)
+        key = video_id or url
+        if key in by_key:
+            by_key[key]["indexes"].append(index)
+            continue
+        by_key[key] = {
+            "url": url,
+            "video_id": video_id,
+            "indexes": [index],
+            "status": "queued",
+            "cached": False,
+            "job_id": None,
+            "error": None
+        }
+        items.append(by_key[key])
+    
+    batch = new_job(None)
+    del batch["url"], batch["result"], batch["stage"]
+    batch.update(
+        type="batch",
+        total=len(urls),
+        items=items,
+        counts={"completed": 0, "failed": 0, "cached": 0}
+    )
+    return batch
+
+def start_batch(urls, decode_options, emit=None):
+    """
+    Start a batch transcription on a background thread (see run_batch).
+    
+    Args:
+        emit: Optional callable(event, data) receiving an "item" event as
+            each video finishes and a "done" event at the end
+    
+    Returns:
+        The batch job dict
+    """
+    batch = new_batch(urls)
+    write_job(batch)
+    prune_jobs()
+    threading.Thread(target=run_batch, args=(batch, decode_options, emit), name=f"batch-{batch['id'][:8]}", daemon=True).start()
+    logger.info(f"Started batch {batch['id']}: {len(urls)} URL(s), {len(batch['items'])} distinct video(s)")
+    return batch
+
+def run_batch(batch, decode_options, emit=None):
+    """
+    Transcribe the videos of a batch, pipelining downloads and inference.
+    
+    Results already in the transcription cache are used right away. The
+    other videos are downloaded into the audio cache on the batch download
+    pool, and each is queued on the job pool as soon as its audio is there,
+    so inference runs while the next downloads are in progress. A video
+    whose download fails is still queued: the job fetches the audio itself.
+    """
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(BATCH_PREFETCH)
+    all_finished = threading.Event()
+    remaining = [len(batch["items"])]
+    started = time.monotonic()
+    
+    def save():
+        finished = batch["counts"]["completed"] + batch["counts"]["failed"]
+        batch["progress"] = round(finished / max(len(batch["items"]), 1), 4)
+        try:
+            write_job(batch)
+        except Exception as e:
+            logger.warning(f"Error writing state of batch {batch['id']}: {str(e)}")
+    
+    def finish(item, transcription=None, error=None, window=True):
+        with lock:
+            item["status"] = "failed" if error else "completed"
+            item["error"] = error
+            batch["counts"]["failed" if error else "completed"] += 1
+            if item["cached"]:
+                batch["counts"]["cached"] += 1
+            save()
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                all_finished.set()
+        if window:
+            in_flight.release()
+        if emit:
+            event = {key: item[key] for key in ("url", "video_id", "indexes", "status", "cached", "job_id")}
+            if error:
+                event["error"] = error
+            else:
+                event.update(transcription)
+            emit("item", event)
+    
+    def on_transcribed(item, future, pins):
+        for pin in pins:
+            pin.release()
+        try:
+            transcription = future.result()
+        except Exception as e:
+            finish(item, error=str(e))
+        else:
+            finish(item, transcription)
+    
+    def fetch_and_queue(item):
+        pins = []
+        try:
+            if AUDIO_CACHE_ENABLED and item["video_id"]:
+                item["status"] = "downloading"
+                try:
+                    prefetch_audio(item["url"], pins)
+                except Exception as e:
+                    logger.warning(f"Batch {batch['id']}: download of {item['url']} failed, leaving it to the job: {str(e)}")
+            
+            while True:
+                try:
+                    job_id, future = submit_transcription_job(item["url"], decode_options)
+                    break
+                except JobQueueFull:
+                    # Other requests filled the queue; this batch's own jobs
+                    # are bounded by BATCH_PREFETCH
+                    time.sleep(1)
+            item.update(status="transcribing", job_id=job_id)
+            future.add_done_callback(lambda future: on_transcribed(item, future, pins))
+        except Exception as e:
+            for pin in pins:
+                pin.release()
+            logger.error(f"Batch {batch['id']}: error queueing {item['url']}: {str(e)}", exc_info=True)
+            finish(item, error=str(e))
+    
+    try:
+        with lock:
+            batch.update(status="running", started_at=time.time())
+            save()
+        for item in batch["items"]:
+            cached = lookup_cached_transcription(item["url"], decode_options)
+            if cached is not None:
+                item.update(cached=True, job_id=create_completed_job(item["url"], cached))
+                finish(item, cached, window=False)
+                continue
+            in_flight.acquire()
+            batch_download_executor.submit(fetch_and_queue, item)
+        all_finished.wait()
+    except Exception as e:
+        logger.error(f"Batch {batch['id']} failed: {str(e)}", exc_info=True)
+        with lock:
+            batch.update(status="failed", finished_at=time.time(), error=str(e))
+            save()
+        if emit:
+            emit("error", {"error": str(e)})
+        return
+    
+    with lock:
+        batch.update(status="completed", finished_at=time.time())
+        save()
+    logger.info(f"Batch {batch['id']} finished in {time.monotonic() - started:.1f}s: {batch['counts']}")
+    if emit:
+        emit("done", dict(batch["counts"], seconds=round(time.monotonic() - started, 3)))
+
+def prefetch_audio(youtube_url, pins):
+    """
+    Download the audio of a video into the audio cache for a later
+    transcription, appending a storage.Pin that keeps it there to pins.
+    """
+    temp_dir = janitor.create_work_dir(TEMP_DIR)
+    try:
+        download_audio(youtube_url, temp_dir, transcode=False, pins=pins)
+    finally:
+        janitor.remove_work_dir(temp_dir)
+
+def stream_batch(urls, decode_options, stream_format):
+    """
+    Streaming /transcribe/batch response.
+    
+    Events, in order:
+        batch  {"batch_id", "total", "unique"}
+        item   one per distinct video as soon as it finishes, in completion
+               order: "url", "video_id", "indexes" (positions in the request's
+               urls), "status" ("completed" or "failed"), "cached", "job_id",
+               then the /transcribe response fields or "error"
+        done   {"completed", "failed", "cached", "seconds"}
+        error  {"error"} instead of done if the batch itself fails
+    
+    Keepalives are sent as in stream_transcription. The batch keeps running
+    if the client disconnects; its state stays available at /jobs/<batch_id>.
+    """
+    events = queue.Queue()
+    batch = start_batch(urls, decode_options, emit=lambda event, data: events.put((event, data)))
+    
+    def generate():
+        yield format_stream_event(stream_format, "batch", {
+            "batch_id": batch["id"],
+            "total": len(urls),
+            "unique": len(batch["items"])
+        })
+        while True:
+            try:
+                event, data = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n" if stream_format == "sse" else format_stream_event(stream_format, "keepalive")
+                continue
+            yield format_stream_event(stream_format, event, data)
+            if event in ("done", "error"):
+                return
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-Id": batch["id"]}
+    return Response(generate(), mimetype=STREAM_MIMETYPES[stream_format], headers=headers)
+
+def load_audio_for_transcription(youtube_url, progress_callback=None):
+    """
+    Get the audio of a YouTube video as 16 kHz mono float32 samples.
+    
+    A cached copy is decoded when available. Otherwise the audio stream is
+    piped through ffmpeg straight into memory, so nothing is written to
+    TEMP_DIR. If streaming is disabled or fails, the audio is downloaded to
+    a temporary directory and decoded from there.
+    
+    Returns:
+        A float32 numpy array of samples
+    """
+    video_id = extract_video_id(youtube_url)
+    
+    if TRANSCRIBE_STREAMING:
+        cached = None
+        if AUDIO_CACHE_ENABLED and video_id:
+            cached = get_cached_audio(video_id, transcode=False)
+        if cached:
+            with cached:
+                if progress_callback:
+                    progress_callback("decoding", 0.4)
+                return decode_audio_file(cached.path)
+        
+        try:
+            return stream_audio(youtube_url, progress_callback)
+        except Exception as e:
+            logger.warning(f"Streaming audio failed, falling back to download: {str(e)}")
+    
+    # Create a unique temporary directory for this request
+    temp_dir = janitor.create_work_dir(TEMP_DIR)
+    pins = []
+    try:
+        audio_path = download_audio(youtube_url, temp_dir, transcode=False, pins=pins)
+        if progress_callback:
+            progress_callback("decoding", 0.4)
+        return decode_audio_file(audio_path)
+    finally:
+        # Clean up temporary files (the audio itself may live in the cache)
+        for pin in pins:
+            pin.release()
+        janitor.remove_work_dir(temp_dir)
+
+def ffmpeg_pcm_command(input_path):
+    """ffmpeg command that decodes input_path to raw 16 kHz mono float32 on stdout."""
+    cmd = [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-threads", "0",
+        "-i", input_path,
+        "-vn",                   # No video
+        "-ac", "1",              # Mono
+        "-ar", str(SAMPLE_RATE), # Whisper's sampling rate
+        "-f", "f32le",           # Raw float32 samples, no conversion needed in Python
+        "pipe:1"
+    ]
+    if input_path != "pipe:0":
+        # Keep ffmpeg from consuming our stdin
+        cmd.insert(1, "-nostdin")
+    return cmd
+
+def read_pcm(stream, expected_seconds=None):
+    """
+    Read raw float32 samples from a stream into a preallocated numpy buffer.
+    
+    The buffer is sized from the expected duration and only grows (by
+    doubling) if the audio turns out to be longer.
+    
+    Returns:
+        A float32 numpy array of the samples read
+    """
+    capacity = int(((expected_seconds or 600) + 5) * SAMPLE_RATE)
+    buffer = np.empty(capacity, dtype=np.float32)
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    
+    while True:
+        if filled == len(view):
+            grown = np.empty(len(buffer) * 2, dtype=np.float32)
+            memoryview(grown).cast("B")[:filled] = view
+            buffer, view = grown, memoryview(grown).cast("B")
+        n = stream.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    
+    return buffer[:filled // 4]
+
+def decode_audio_file(audio_path):
+    """
+    Decode an audio file to 16 kHz mono float32 samples with a single ffmpeg run.
+    
+    Returns:
+        A float32 numpy array of samples
+    """
+    process = subprocess.Popen(ffmpeg_pcm_command(audio_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    audio = read_pcm(process.stdout)
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise Exception(f"ffmpeg failed to decode audio: {stderr.decode(errors='replace')}")
+    return audio
+
+def video_info_cache_key(youtube_url):
+    """Video info is cached by video ID, or by URL when there is no ID."""
+    return extract_video_id(youtube_url) or youtube_url
+
+def get_video_info(youtube_url):
+    """
+    Get the unprocessed yt-dlp information of a video with one metadata call.
+    
+    Results are cached for VIDEO_INFO_TTL seconds, so pre-flight checks and
+    the download that follows resolve the video only once.
+    
+    Returns:
+        An (info, cache_hit) tuple
+    """
+    info = peek_video_info(youtube_url)
+    if info is not None:
+        return info, True
+    
+    with yt_dlp_pool.acquire("metadata") as ydl:
+        info = ydl.extract_info(youtube_url, download=False, process=False)
+    if not info:
+        raise Exception("Could not extract video information")
+    
+    with video_info_lock:
+        video_info_cache[video_info_cache_key(youtube_url)] = (time.monotonic() + VIDEO_INFO_TTL, info)
+        video_info_cache.move_to_end(video_info_cache_key(youtube_url))
+        while len(video_info_cache) > VIDEO_INFO_CACHE_SIZE:
+            video_info_cache.popitem(last=False)
+    return info, False
 
-# Load the model
-try:
-    model = whisper.load_model(model_size, device=device)
-    logger.info(f"Whisper model {model_size} loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading Whisper model: {str(e)}", exc_info=True)
-    raise
+def peek_video_info(youtube_url):
+    """
+    Get the cached yt-dlp information of a video without any network call.
+    
+    Returns:
+        The unprocessed info dict, or None if it isn't cached or has expired
+    """
+    key = video_info_cache_key(youtube_url)
+    with video_info_lock:
+        entry = video_info_cache.get(key)
+        if entry is None:
+            video_info_stats["misses"] += 1
+            return None
+        expires, info = entry
+        if time.monotonic() >= expires:
+            del video_info_cache[key]
+            video_info_stats["misses"] += 1
+            return None
+        video_info_cache.move_to_end(key)
+        video_info_stats["hits"] += 1
+        return info
 
-@app.route('/')
-def index():
+def resolve_audio_stream(youtube_url, best_quality=False):
     """
-    Render the web interface.
+    Resolve the direct URL of an audio-only stream of a video.
+    
+    Args:
+        youtube_url: The YouTube video URL
+        best_quality: Pick the highest-bitrate audio stream (for MP3 downloads)
+            instead of the smallest one (for transcription)
+    
+    Returns:
+        A (stream_url, http_headers, duration) tuple
     """
-    return render_template('index.html')
+    from yt_dlp.utils import determine_protocol
+    
+    raw_info, _ = get_video_info(youtube_url)
+    with yt_dlp_pool.acquire("metadata") as ydl:
+        # Format selection only; the (possibly cached) info is not modified
+        info = ydl.process_ie_result(copy.deepcopy(raw_info), download=False)
+    
+    if best_quality:
+        # Processed formats carry the HTTP headers to send; the protocol is
+        # determined from the URL when the extractor didn't set it
+        candidates = [
+            f for f in info.get("formats") or []
+            if f.get("url") and determine_protocol(f) in ("http", "https")
+            and f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+        ]
+        if not candidates:
+            raise Exception("No directly downloadable audio-only stream")
+        stream = max(candidates, key=lambda f: f.get("abr") or f.get("tbr") or 0)
+        return stream["url"], stream.get("http_headers") or info.get("http_headers") or {}, info.get("duration")
+    
+    stream = (info.get("requested_formats") or [info])[0]
+    if not stream.get("url") or stream.get("protocol") not in ("http", "https"):
+        raise Exception(f"No directly downloadable audio stream (protocol: {stream.get('protocol')})")
+    
+    return stream["url"], stream.get("http_headers") or info.get("http_headers") or {}, info.get("duration")
 
-@app.route('/health')
-def health_check():
+def fetch_stream(stream_url, headers, write, progress_callback=None, cancel_token=None):
     """
-    Health check endpoint.
+    Download a stream in STREAM_CHUNK_SIZE ranged requests (YouTube throttles
+    large single requests), passing every chunk to write(chunk) as it arrives.
+    
+    Args:
+        progress_callback: Optional callable(received_bytes, total_bytes)
+        cancel_token: Optional CancelToken checked between chunks
     """
-    return jsonify({
-        "status": "ok",
-        "version": "1.0.0",
-        "whisper_model": model_size,
-        "hostname": os.environ.get("HOSTNAME", "unknown")
-    })
+    start = 0
+    total = None
+    while total is None or start < total:
+        response = http_session.get(
+            stream_url, headers=dict(headers, Range=f"bytes={start}-{start + STREAM_CHUNK_SIZE - 1}"),
+            stream=True, timeout=60
+        )
+        if response.status_code not in (200, 206):
+            raise Exception(f"Audio stream request failed with status code: {response.status_code}")
+        
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            total = int(content_range.rsplit("/", 1)[1])
+        
+        received = 0
+        with response:
+            for chunk in response.iter_content(chunk_size=256 * 1024):
+                if cancel_token:
+                    cancel_token.check()
+                write(chunk)
+                received += len(chunk)
+        start += received
+        
+        if progress_callback and total:
+            progress_callback(start, total)
+        # Servers that ignore Range send everything at once
+        if response.status_code == 200 or received == 0:
+            break
 
-@app.route('/transcribe', methods=['POST'])
-def transcribe_video():
+def stream_audio(youtube_url, progress_callback=None):
     """
-    Endpoint to transcribe a YouTube video.
+    Fetch a video's audio stream and decode it in memory.
     
-    Expected JSON payload:
-    {
-        "url": "https://www.youtube.com/watch?v=VIDEO_ID"
-    }
+    The stream is downloaded in ranged chunks and written to the stdin of a
+    single ffmpeg process, whose raw PCM output is read into a numpy buffer
+    while the download is still running.
+    
+    Returns:
+        A float32 numpy array of samples
     """
-    data = request.get_json()
+    stream_url, headers, duration = resolve_audio_stream(youtube_url)
+    logger.info(f"Streaming audio for URL: {youtube_url}")
     
-    if not data or 'url' not in data:
-        return jsonify({"error": "URL is required"}), 400
+    process = subprocess.Popen(ffmpeg_pcm_command("pipe:0"), stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    feed_error = []
     
-    youtube_url = data['url']
-    logger.info(f"Transcription request for URL: {youtube_url}")
+    def report(received, total):
+        if progress_callback:
+            progress_callback("downloading", 0.1 + 0.4 * min(received / total, 1.0))
     
-    try:
-        # Create a unique temporary directory for this request
-        temp_dir = os.path.join(TEMP_DIR, str(uuid.uuid4()))
-        os.makedirs(temp_dir, exist_ok=True)
-        
+    def feed():
         try:
-            # Download audio from YouTube
-            audio_path = download_audio(youtube_url, temp_dir)
-            
-            # Transcribe the audio using the Whisper model
-            logger.info(f"Transcribing audio file: {audio_path}")
-            result = model.transcribe(audio_path, fp16=False if device == "cpu" else True)
-            
-            # Clean up temporary files
-            try:
-                os.remove(audio_path)
-                os.rmdir(temp_dir)
-            except Exception as e:
-                logger.warning(f"Error cleaning up temporary files: {str(e)}")
-            
-            return jsonify({
-                "transcription": result["text"],
-                "segments": result["segments"]
-            })
+            fetch_stream(stream_url, headers, process.stdin.write, report)
         except Exception as e:
-            # Clean up temporary directory if it exists
+            feed_error.append(e)
+        finally:
             try:
-                import shutil
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            except:
+                process.stdin.close()
+            except OSError:
                 pass
-            
-            # Re-raise the exception to be caught by the outer try-except
-            raise e
     
-    except Exception as e:
-        logger.error(f"Error transcribing video: {str(e)}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+    feeder = threading.Thread(target=feed, name="audio-stream-feeder", daemon=True)
+    feeder.start()
+    try:
+        audio = read_pcm(process.stdout, duration)
+        stderr = process.stderr.read()
+        returncode = process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+        feeder.join()
+    
+    if returncode != 0:
+        raise Exception(f"ffmpeg failed to decode audio stream: {stderr.decode(errors='replace')}")
+    if feed_error:
+        raise feed_error[0]
+    if len(audio) == 0:
+        raise Exception("Audio stream decoded to no samples")
+    return audio
 
-@app.route('/downloads', methods=['GET'])
-def download_mp3():
+def ffmpeg_mp3_command(input_path, output_path):
+    """ffmpeg command that encodes input_path to 192 kbps MP3, like the download methods."""
+    return [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-i", input_path,
+        "-vn",           # No video
+        "-ar", "44100",  # Audio sampling rate
+        "-ac", "2",      # Stereo
+        "-b:a", "192k",  # Bitrate
+        "-f", "mp3",     # Format
+        output_path
+    ]
+
+class DownloadInProgress(Exception):
+    """Raised by stream_mp3 when another worker process is already producing the video's MP3."""
+
+# MP3 encodes running in this process, by video ID (see stream_mp3)
+mp3_encodes = {}
+mp3_encodes_lock = threading.Lock()
+
+def stream_mp3(youtube_url):
     """
-    Endpoint to download a YouTube video as MP3.
+    Encode a video's audio to MP3 while it is still downloading.
     
-    Expected query parameters:
-    url: The YouTube video URL
-    """
-    youtube_url = request.args.get('url')
+    Concurrent requests for the same video share one encode (see
+    Mp3Encode), and a request finding the video's MP3 being downloaded by
+    another worker process gets DownloadInProgress: it should wait for the
+    regular download (download_audio), which serves the file once it is
+    cached. The stream is resolved before this returns, so a video that
+    can't be streamed fails here, before any byte is sent, and the caller
+    can fall back to a regular download.
     
-    if not youtube_url:
-        return jsonify({"error": "URL is required"}), 400
+    Closing the returned iterable (the client disconnected) leaves the
+    encode, which is cancelled once it has no clients left.
     
-    logger.info(f"Download request for URL: {youtube_url}")
+    Returns:
+        An iterable of MP3 byte chunks, with a close() method
+    
+    Raises:
+        DownloadInProgress: If another worker process is downloading the MP3
+    """
+    video_id = extract_video_id(youtube_url)
+    with mp3_encodes_lock:
+        encode = mp3_encodes.get(video_id) if video_id else None
+        listener = encode.join() if encode else None
+        if listener is None:
+            encode = Mp3Encode(youtube_url, video_id)
+            listener = encode.join()
+            if video_id:
+                mp3_encodes[video_id] = encode
+            leader = True
+        else:
+            leader = False
     
     try:
-        # Create a unique temporary directory for this request
-        temp_dir = os.path.join(TEMP_DIR, str(uuid.uuid4()))
-        os.makedirs(temp_dir, exist_ok=True)
+        if leader:
+            encode.start()
+        else:
+            logger.info(f"Joining the MP3 stream in progress for video ID {video_id}")
+            with download_stream_lock:
+                download_stream_stats["coalesced"] += 1
+            encode.wait_started()
+    except Exception:
+        listener.close()
+        raise
+    return listener
+
+class Mp3Encode:
+    """
+    A progressive MP3 encode of one video, sent to every client that asks
+    for the video while it runs.
+    
+    The audio stream is fetched in ranged chunks into the stdin of an ffmpeg
+    MP3 encoder, whose output is spooled to a file in a work directory.
+    Each client reads the spool file from the start at its own pace, so
+    clients that join late still get the whole MP3. The encode is cancelled
+    when its last client leaves. A complete MP3 is moved into the audio
+    cache while the cross-worker lock of the video's MP3 (the one
+    download_audio takes) is held.
+    """
+    
+    def __init__(self, youtube_url, video_id):
+        self.youtube_url = youtube_url
+        self.video_id = video_id
+        self.cached = bool(AUDIO_CACHE_ENABLED and video_id)
+        self._condition = threading.Condition()
+        self._token = CancelToken()
+        self._started = threading.Event()
+        self._start_error = None
+        self._clients = 0
+        self._size = 0
+        self._done = False
+        self._error = None
+        self._spool_fd = None
+    
+    def join(self):
+        """
+        Add a client.
         
-        # Download audio from YouTube
-        audio_path = download_audio(youtube_url, temp_dir)
+        Returns:
+            An Mp3Listener, or None if the encode was cancelled
+        """
+        with self._condition:
+            if self._token.cancelled:
+                return None
+            self._clients += 1
+        return Mp3Listener(self)
+    
+    def leave(self):
+        with self._condition:
+            self._clients -= 1
+            if self._clients > 0:
+                return
+            if not self._done and self._started.is_set() and self._start_error is None:
+                logger.info(f"All clients disconnected after {self._size} bytes, cancelling MP3 stream for URL: {self.youtube_url}")
+            self._token.cancel()
+            self._close_spool()
+    
+    def start(self):
+        """
+        Take the video's download lock, resolve the audio stream and start
+        encoding on a background thread.
+        
+        Raises:
+            DownloadInProgress: If another worker process is downloading the
+                video's MP3, or has just cached it
+        """
+        resources = ExitStack()
+        try:
+            if self.cached:
+                try:
+                    resources.enter_context(file_lock(audio_lock_path(self.video_id), 0))
+                except TimeoutError:
+                    raise DownloadInProgress(f"Audio for video ID {self.video_id} is being downloaded by another worker")
+                if os.path.exists(audio_store.path(audio_cache_name(self.video_id))):
+                    raise DownloadInProgress(f"Audio for video ID {self.video_id} has just been cached")
+            
+            stream_url, headers, _ = resolve_audio_stream(self.youtube_url, best_quality=True)
+            logger.info(f"Streaming MP3 for URL: {self.youtube_url}")
+            
+            temp_dir = janitor.create_work_dir(TEMP_DIR)
+            resources.callback(janitor.remove_work_dir, temp_dir)
+            spool = resources.enter_context(open(os.path.join(temp_dir, f"{self.video_id or 'audio'}.mp3"), "wb"))
+            self._spool_fd = os.open(spool.name, os.O_RDONLY)
+            
+            process = subprocess.Popen(ffmpeg_mp3_command("pipe:0", "pipe:1"), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._token.register(process)
+            threading.Thread(target=self._run, args=(resources, process, spool, stream_url, headers),
+                             name="mp3-encoder", daemon=True).start()
+        except Exception as e:
+            resources.close()
+            with self._condition:
+                self._start_error = e
+                self._done = True
+                self._close_spool()
+            self._unregister()
+            raise
+        finally:
+            self._started.set()
+        
+        with download_stream_lock:
+            download_stream_stats["started"] += 1
+    
+    def wait_started(self):
+        """Wait until the leader has started the encode, raising its error if it couldn't."""
+        self._started.wait()
+        if self._start_error is not None:
+            raise self._start_error
+    
+    def _run(self, resources, process, spool, stream_url, headers):
+        feed_error = []
         
-        # Get video title for filename
-        video_id = youtube_url.split("v=")[-1].split("&")[0]
-        filename = f"youtube_audio_{video_id}.mp3"
+        def feed():
+            try:
+                fetch_stream(stream_url, headers, process.stdin.write, cancel_token=self._token)
+            except Exception as e:
+                feed_error.append(e)
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
         
-        # Send the file to the client
-        response = make_response(send_file(
-            audio_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="audio/mpeg"
-        ))
+        outcome = "failed"
+        error = None
+        with resources:
+            try:
+                threading.Thread(target=feed, name="mp3-stream-feeder", daemon=True).start()
+                while True:
+                    chunk = process.stdout.read1(64 * 1024)
+                    if not chunk:
+                        break
+                    spool.write(chunk)
+                    spool.flush()
+                    with self._condition:
+                        self._size += len(chunk)
+                        self._condition.notify_all()
+                
+                stderr = process.stderr.read()
+                returncode = process.wait()
+                self._token.check()
+                if returncode != 0:
+                    raise Exception(f"ffmpeg failed to encode audio stream: {stderr.decode(errors='replace')}")
+                if feed_error:
+                    raise feed_error[0]
+                
+                spool.close()
+                if self.cached:
+                    try:
+                        publish_cached_audio(self.video_id, spool.name)
+                    except Exception as e:
+                        # The clients have the whole MP3 regardless
+                        logger.warning(f"Could not cache streamed MP3 for video ID {self.video_id}: {str(e)}")
+                outcome = "completed"
+            except DownloadCancelled as e:
+                error = e
+                outcome = "cancelled"
+            except Exception as e:
+                # Headers are already sent: aborting the responses is the only
+                # way left to tell the clients the download is incomplete
+                logger.error(f"Error streaming MP3 after {self._size} bytes: {str(e)}")
+                error = e
+            finally:
+                # Stops the feeder at its next chunk and kills the encoder
+                self._token.cancel()
+                process.wait()
+                with self._condition:
+                    self._done = True
+                    self._error = error
+                    self._condition.notify_all()
+                    if self._clients == 0:
+                        self._close_spool()
+                self._unregister()
         
-        # Add headers to prevent caching
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        with download_stream_lock:
+            download_stream_stats[outcome] += 1
+            if outcome == "completed":
+                download_stream_stats["bytes"] += self._size
+    
+    def read(self, offset, size=64 * 1024):
+        """
+        Read the MP3 at offset, waiting for the encoder to get there.
         
-        # Clean up temporary files after sending (this won't work as expected, but we'll handle it)
-        # We'll need a background task or a cleanup job for production
+        Returns:
+            Up to size bytes, or b"" at the end of a complete MP3
         
-        return response
+        Raises:
+            Exception: The error that stopped the encode
+        """
+        with self._condition:
+            while offset >= self._size and not self._done:
+                self._condition.wait()
+            available = self._size - offset
+            if available <= 0:
+                if self._error is not None:
+                    raise self._error
+                return b""
+        # The spool stays open while this client hasn't left
+        return os.pread(self._spool_fd, min(size, available), offset)
     
-    except Exception as e:
-        logger.error(f"Error downloading audio: {str(e)}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+    def _close_spool(self):
+        if self._spool_fd is not None:
+            os.close(self._spool_fd)
+            self._spool_fd = None
+    
+    def _unregister(self):
+        with mp3_encodes_lock:
+            if self.video_id and mp3_encodes.get(self.video_id) is self:
+                del mp3_encodes[self.video_id]
+
+class Mp3Listener:
+    """One client's position in an Mp3Encode: a WSGI response body."""
+    
+    def __init__(self, encode):
+        self.encode = encode
+        self.offset = 0
+        self.closed = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        chunk = self.encode.read(self.offset)
+        if not chunk:
+            raise StopIteration
+        self.offset += len(chunk)
+        return chunk
+    
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.encode.leave()
 
-def download_audio(youtube_url, temp_dir):
+def download_audio(youtube_url, temp_dir, transcode=True, pins=None):
     """
     Download audio from a YouTube video.
     
+    The audio cache is checked first; fresh downloads are published to it.
+    
     Args:
         youtube_url: The YouTube video URL
         temp_dir: Directory to save the downloaded audio
-        
+        transcode: Convert to 192 kbps MP3. Without it the smallest audio-only
+            stream is kept as downloaded, which is all transcription needs
+        pins: Optional list that receives the storage.Pin keeping a cached
+            file from being evicted; release it when done with the file
+    
     Returns:
-        The path to the downloaded audio file
+        The path to the downloaded audio file (inside temp_dir or the cache)
     """
-    output_template = os.path.join(temp_dir, "audio.%(ext)s")
-    audio_path = os.path.join(temp_dir, "audio.mp3")
-    
-    # Set environment variables for SSL
-    os.environ['SSL_CERT_FILE'] = certifi.where()
-    os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
-    os.environ['PYTHONHTTPSVERIFY'] = '0'
-    
     # Extract video ID from URL
-    video_id = None
-    if "v=" in youtube_url:
-        video_id = youtube_url.split("v=")[1].split("&")[0]
-    elif "youtu.be/" in youtube_url:
-        video_id = youtube_url.split("youtu.be/")[1].split("?")[0]
+    video_id = extract_video_id(youtube_url)
     
     if video_id:
         logger.info(f"Extracted video ID: {video_id}")
     
-    # Try multiple methods to download the audio
-    methods = [
-        download_with_yt_dlp,
-        download_with_yt_dlp_command,
-        download_with_pytube,
-        download_with_requests_direct
-    ]
+    # Without a cache entry to share there is nothing to coalesce: the file
+    # lives in the leader's temp_dir, which it deletes when it is done
+    if not (AUDIO_CACHE_ENABLED and video_id):
+        return download_audio_uncached(youtube_url, video_id, temp_dir, transcode)
+    
+    pin = get_cached_audio(video_id, transcode)
+    if pin:
+        if pins is None:
+            pin.release()
+        else:
+            pins.append(pin)
+        return pin.path
+    
+    variant = "mp3" if transcode else "source"
+    
+    def download_once():
+        # Another worker process may be downloading the same video; wait for
+        # it and reuse the cached file
+        with file_lock(audio_lock_path(video_id, transcode), SINGLEFLIGHT_TIMEOUT):
+            cached_path = audio_store.path(audio_cache_name(video_id, transcode))
+            if os.path.exists(cached_path):
+                return cached_path
+            result = download_audio_uncached(youtube_url, video_id, temp_dir, transcode)
+            return publish_cached_audio(video_id, result, transcode)
+    
+    cached_path = download_flights.do(f"{video_id}:{variant}", download_once, SINGLEFLIGHT_TIMEOUT)
+    if pins is None:
+        return cached_path
+    
+    # Every request sharing the download takes its own reference
+    pin = audio_store.pin(os.path.basename(cached_path))
+    if pin is None:
+        raise Exception("Downloaded audio was evicted from the cache before it could be used; the cache budget is too small")
+    pins.append(pin)
+    return pin.path
+
+def download_audio_uncached(youtube_url, video_id, temp_dir, transcode=True):
+    """
+    Download audio from a YouTube video, trying each download method in turn.
+    
+    Args:
+        youtube_url: The YouTube video URL
+        video_id: The video ID, or None if it couldn't be extracted
+        temp_dir: Directory to save the downloaded audio
+        transcode: Convert to MP3 (see download_audio)
+    
+    Returns:
+        The path to the downloaded audio file inside temp_dir
+    """
+    output_template = os.path.join(temp_dir, "audio.%(ext)s")
+    audio_path = os.path.join(temp_dir, "audio.mp3" if transcode else "audio.source")
+    
+    if HEDGED_DOWNLOADS:
+        return download_audio_hedged(youtube_url, video_id, temp_dir, audio_path, transcode)
     
+    # Try multiple methods to download the audio, best performing first
     last_error = None
-    for method in methods:
+    for method in method_health.order(download_methods()):
+        started = time.monotonic()
         try:
             logger.info(f"Trying download method: {method.__name__}")
-            result = method(youtube_url, video_id, temp_dir, output_template, audio_path)
+            result = method(youtube_url, video_id, temp_dir, output_template, audio_path, transcode)
             if result and os.path.exists(result):
                 logger.info(f"Download successful with {method.__name__}")
+                method_health.record(method.__name__, True, time.monotonic() - started)
                 return result
+            method_health.record(method.__name__, False, time.monotonic() - started)
         except Exception as e:
             last_error = e
             logger.warning(f"{method.__name__} failed: {str(e)}")
+            method_health.record(method.__name__, False, time.monotonic() - started)
     
     # If all methods failed, raise the last error
     raise Exception(f"Failed to download audio from YouTube after trying all methods: {str(last_error)}")
 
-def download_with_yt_dlp(youtube_url, video_id, temp_dir, output_template, audio_path):
-    """Download audio using yt-dlp Python library"""
-    # Set environment variables for SSL
-    os.environ['SSL_CERT_FILE'] = certifi.where()
-    os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
-    os.environ['PYTHONHTTPSVERIFY'] = '0'
+def download_methods():
+    """The download methods, in the order they are tried."""
+    return [
+        download_with_yt_dlp,
+        download_with_yt_dlp_command,
+        download_with_pytube,
+        download_with_requests_direct
+    ]
+
+class MethodHealthTracker:
+    """
+    Rolling success rate and latency per download method, with a circuit
+    breaker for each.
+    
+    A breaker opens after METHOD_BREAKER_THRESHOLD consecutive failures and
+    the method is skipped. Once METHOD_BREAKER_COOLDOWN has passed it goes
+    half-open: a single request may probe it, and the breaker closes again
+    on success or restarts its cooldown on failure.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, window, threshold, cooldown):
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._methods = {}
+    
+    def _get(self, name):
+        health = self._methods.get(name)
+        if health is None:
+            health = self._methods[name] = {
+                "outcomes": deque(maxlen=self.window),
+                "consecutive_failures": 0,
+                "state": self.CLOSED,
+                "opened_at": None,
+                "successes": 0,
+                "failures": 0
+            }
+        return health
+    
+    @staticmethod
+    def _rank(health):
+        outcomes = health["outcomes"]
+        # Laplace-smoothed success rate, so untried methods start at 0.5
+        success_rate = (sum(1 for ok, _ in outcomes if ok) + 1) / (len(outcomes) + 2)
+        latencies = [latency for ok, latency in outcomes if ok]
+        latency = sum(latencies) / len(latencies) if latencies else float("inf")
+        return -round(success_rate, 1), latency
+    
+    def order(self, methods, reserve_probes=True):
+        """
+        Order methods for a download attempt.
+        
+        Healthy methods come first, best success rate and then lowest latency
+        first (ties keep the given order). Methods whose breaker is ready for
+        a probe are appended at the end; with reserve_probes the probe is
+        handed out here, so only one request probes per cooldown. If every
+        breaker is open, all methods are returned as a last resort.
+        """
+        now = time.monotonic()
+        healthy = []
+        probes = []
+        with self._lock:
+            for index, method in enumerate(methods):
+                health = self._get(method.__name__)
+                if health["state"] == self.CLOSED:
+                    healthy.append((self._rank(health), index, method))
+                elif now - health["opened_at"] >= self.cooldown:
+                    probes.append(method)
+                    if reserve_probes:
+                        health["state"] = self.HALF_OPEN
+                        health["opened_at"] = now
+        
+        ordered = [method for _, _, method in sorted(healthy, key=lambda item: item[:2])] + probes
+        if not ordered:
+            logger.warning("All download method circuit breakers are open, trying every method")
+            return list(methods)
+        return ordered
+    
+    def record(self, name, success, latency):
+        """Record the outcome of one attempt with a method."""
+        with self._lock:
+            health = self._get(name)
+            health["outcomes"].append((success, latency))
+            if success:
+                health["successes"] += 1
+                health["consecutive_failures"] = 0
+                if health["state"] != self.CLOSED:
+                    logger.info(f"Circuit breaker for {name} closed")
+                health["state"] = self.CLOSED
+                health["opened_at"] = None
+            else:
+                health["failures"] += 1
+                health["consecutive_failures"] += 1
+                if health["state"] != self.CLOSED or health["consecutive_failures"] >= self.threshold:
+                    logger.warning(f"Circuit breaker for {name} opened after {health['consecutive_failures']} consecutive failures")
+                    health["state"] = self.OPEN
+                    health["opened_at"] = time.monotonic()
+    
+    def snapshot(self):
+        """Current state of every tracked method."""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for name, health in self._methods.items():
+                outcomes = health["outcomes"]
+                latencies = [latency for ok, latency in outcomes if ok]
+                result[name] = {
+                    "state": health["state"],
+                    "consecutive_failures": health["consecutive_failures"],
+                    "success_rate": sum(1 for ok, _ in outcomes if ok) / len(outcomes) if outcomes else None,
+                    "avg_success_latency": sum(latencies) / len(latencies) if latencies else None,
+                    "window": len(outcomes),
+                    "successes": health["successes"],
+                    "failures": health["failures"],
+                    "retry_in": max(0.0, self.cooldown - (now - health["opened_at"])) if health["opened_at"] is not None else None
+                }
+            return result
+
+method_health = MethodHealthTracker(METHOD_STATS_WINDOW, METHOD_BREAKER_THRESHOLD, METHOD_BREAKER_COOLDOWN)
+
+class DownloadCancelled(Exception):
+    """Raised inside a download method that lost a hedged download race."""
+
+class CancelToken:
+    """
+    Cancellation signal for one download attempt.
+    
+    Subprocesses registered with the token are killed when it is cancelled.
+    """
+    
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+    
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+    
+    def cancel(self):
+        """Cancel the attempt and kill its running subprocesses."""
+        with self._lock:
+            self._cancelled.set()
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+    
+    def check(self):
+        """Raise DownloadCancelled if the attempt was cancelled."""
+        if self.cancelled:
+            raise DownloadCancelled("Download attempt cancelled")
+    
+    def register(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self.cancelled
+        if cancelled:
+            process.kill()
+    
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+def run_command(cmd, cancel_token=None):
+    """
+    Run a command like subprocess.run(cmd, capture_output=True, text=True).
+    
+    With a cancel token the process is killed as soon as the token is cancelled.
+    """
+    if cancel_token is None:
+        return subprocess.run(cmd, capture_output=True, text=True)
+    
+    cancel_token.check()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    cancel_token.register(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        cancel_token.unregister(process)
+    cancel_token.check()
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+def directory_size(path):
+    """Total size in bytes of the files below path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+def download_audio_hedged(youtube_url, video_id, temp_dir, audio_path, transcode=True):
+    """
+    Download audio by racing the download methods against each other.
+    
+    The first method starts right away. Whenever none of the running
+    attempts has written new bytes for HEDGE_DELAY seconds (or one fails),
+    the next method is started alongside, up to HEDGE_MAX_PARALLEL at a time.
+    The first attempt to produce an audio file wins; the others are
+    cancelled, their subprocesses killed and their files removed.
+    
+    Returns:
+        The path to the downloaded audio file inside temp_dir
+    """
+    pending_methods = method_health.order(download_methods())
+    executor = ThreadPoolExecutor(max_workers=len(pending_methods), thread_name_prefix="hedged-download")
+    attempts = {}
+    last_error = None
+    winner = None
+    
+    def launch():
+        method = pending_methods.pop(0)
+        attempt_dir = os.path.join(temp_dir, f"attempt-{method.__name__}")
+        os.makedirs(attempt_dir, exist_ok=True)
+        token = CancelToken()
+        logger.info(f"Starting hedged download method: {method.__name__}")
+        future = executor.submit(
+            method, youtube_url, video_id, attempt_dir,
+            os.path.join(attempt_dir, "audio.%(ext)s"),
+            os.path.join(attempt_dir, os.path.basename(audio_path)),
+            transcode, token
+        )
+        attempts[future] = {"method": method, "dir": attempt_dir, "token": token,
+                            "size": 0, "progress_at": time.monotonic(), "started": time.monotonic()}
+    
+    try:
+        launch()
+        while attempts and winner is None:
+            done, _ = wait_futures(list(attempts), timeout=0.5, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                attempt = attempts.pop(future)
+                name = attempt["method"].__name__
+                latency = time.monotonic() - attempt["started"]
+                try:
+                    result = future.result()
+                    if result and os.path.exists(result):
+                        logger.info(f"Hedged download won by {name}")
+                        method_health.record(name, True, latency)
+                        os.replace(result, audio_path)
+                        shutil.rmtree(attempt["dir"], ignore_errors=True)
+                        winner = audio_path
+                        break
+                    raise Exception(f"{name} produced no audio file")
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"{name} failed: {str(e)}")
+                    method_health.record(name, False, latency)
+                    shutil.rmtree(attempt["dir"], ignore_errors=True)
+            
+            if winner is not None:
+                break
+            
+            # Track which running attempts are still receiving data
+            now = time.monotonic()
+            stalled = True
+            for attempt in attempts.values():
+                size = directory_size(attempt["dir"])
+                if size > attempt["size"]:
+                    attempt["size"] = size
+                    attempt["progress_at"] = now
+                if now - attempt["progress_at"] < HEDGE_DELAY:
+                    stalled = False
+            
+            if pending_methods and len(attempts) < HEDGE_MAX_PARALLEL and (not attempts or stalled):
+                launch()
+        
+        if winner is None:
+            raise Exception(f"Failed to download audio from YouTube after trying all methods: {str(last_error)}")
+        return winner
+    finally:
+        # Cancel the losers and remove their files once they have stopped
+        for future, attempt in attempts.items():
+            logger.info(f"Cancelling hedged download method: {attempt['method'].__name__}")
+            attempt["token"].cancel()
+            future.add_done_callback(lambda _, path=attempt["dir"]: shutil.rmtree(path, ignore_errors=True))
+        executor.shutdown(wait=False)
+
+def yt_dlp_options(profile):
+    """
+    yt-dlp options for a pool profile.
     
-    # Configure SSL context
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    ssl._create_default_https_context = lambda: ssl_context
+    Profiles:
+        mp3: download the best audio and convert it to 192 kbps MP3
+        source: download the smallest audio stream as is (for transcription)
+        metadata: only resolve video information and stream URLs
+    """
+    if profile == "metadata":
+        return {
+            'format': TRANSCRIBE_AUDIO_FORMAT,
+            'quiet': True,
+            'no_warnings': True,
+            'geo_bypass': True,
+            'nocheckcertificate': True,
+            'socket_timeout': 60,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['android', 'web'],
+                }
+            },
+        }
     
-    # Configure yt-dlp options
     ydl_opts = {
         'format': 'bestaudio/best',
         'postprocessors': [{
@@ -304,7 +3058,7 @@ def download_with_yt_dlp(youtube_url, video_id, temp_dir, output_template, audio
             'preferredcodec': 'mp3',
             'preferredquality': '192',
         }],
-        'outtmpl': output_template,
+        'outtmpl': os.path.join(TEMP_DIR, "audio.%(ext)s"),  # Replaced on every use
         'quiet': False,
         'no_warnings': False,
         'ignoreerrors': True,
@@ -335,30 +3089,138 @@ def download_with_yt_dlp(youtube_url, video_id, temp_dir, output_template, audio
         'compat_opts': ['no-youtube-unavailable-videos', 'no-youtube-prefer-utc-upload-date'],
     }
     
+    if profile == "source":
+        # Keep the smallest audio stream as is, skipping the MP3 encode
+        ydl_opts['format'] = TRANSCRIBE_AUDIO_FORMAT
+        ydl_opts['postprocessors'] = []
+    
+    return ydl_opts
+
+class YoutubeDLPool:
+    """
+    Per-process pool of pre-configured yt_dlp.YoutubeDL instances.
+    
+    Building a YoutubeDL is not free (option parsing, extractor and
+    postprocessor setup), and each instance keeps its own HTTP connections
+    alive, so reusing instances also avoids repeated TLS handshakes to the
+    same YouTube hosts. Instances are kept per option profile; at most
+    max_idle idle instances are kept per profile.
+    """
+    
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._stats = {"created": 0, "reused": 0, "discarded": 0}
+    
+    def _create(self, profile):
+        import yt_dlp
+        
+        ydl = yt_dlp.YoutubeDL(yt_dlp_options(profile))
+        ydl._pool_cancel_token = None
+        
+        # yt-dlp aborts the download when a progress hook raises DownloadCancelled
+        def check_cancelled(_):
+            cancel_token = ydl._pool_cancel_token
+            if cancel_token is not None and cancel_token.cancelled:
+                raise yt_dlp.utils.DownloadCancelled("Download attempt cancelled")
+        ydl.add_progress_hook(check_cancelled)
+        return ydl
+    
+    @contextmanager
+    def acquire(self, profile, output_template=None, cancel_token=None):
+        """
+        Borrow an instance for one download or extraction.
+        
+        Args:
+            profile: Option profile (see yt_dlp_options)
+            output_template: Output template for this use
+            cancel_token: Optional CancelToken that aborts the download
+        """
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            ydl = idle.pop() if idle else None
+            self._stats["reused" if ydl else "created"] += 1
+        if ydl is None:
+            ydl = self._create(profile)
+        
+        ydl._pool_cancel_token = cancel_token
+        if output_template:
+            ydl.params['outtmpl']['default'] = output_template
+        
+        healthy = False
+        try:
+            yield ydl
+            healthy = True
+        finally:
+            ydl._pool_cancel_token = None
+            with self._lock:
+                idle = self._idle[profile]
+                keep = healthy and len(idle) < self.max_idle
+                if keep:
+                    idle.append(ydl)
+                else:
+                    self._stats["discarded"] += 1
+            if not keep:
+                # An interrupted instance may be in an odd state, don't reuse it
+                ydl.close()
+    
+    def close(self):
+        """Close all idle instances."""
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+        for ydl in instances:
+            ydl.close()
+    
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, idle={profile: len(idle) for profile, idle in self._idle.items()})
+
+yt_dlp_pool = YoutubeDLPool(YTDL_POOL_SIZE)
+atexit.register(yt_dlp_pool.close)
+
+def find_downloaded_audio(temp_dir):
+    """Find the file yt-dlp wrote for the "audio.%(ext)s" template, skipping partial files."""
+    for name in sorted(os.listdir(temp_dir)):
+        if name.startswith("audio.") and not name.endswith((".part", ".ytdl", ".temp")):
+            return os.path.join(temp_dir, name)
+    return None
+
+def download_with_yt_dlp(youtube_url, video_id, temp_dir, output_template, audio_path, transcode=True, cancel_token=None):
+    """Download audio using yt-dlp Python library"""
+    profile = "mp3" if transcode else "source"
+    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Reuse metadata resolved earlier (e.g. by /info or the streaming
+        # path) instead of extracting the video again
+        cached_info = peek_video_info(youtube_url)
+        with yt_dlp_pool.acquire(profile, output_template, cancel_token) as ydl:
             logger.info(f"Downloading audio with yt-dlp: {youtube_url}")
-            ydl.download([youtube_url])
-            
+            if cached_info is not None:
+                ydl.process_ie_result(copy.deepcopy(cached_info), download=True)
+            else:
+                ydl.download([youtube_url])
+        
+        if not transcode:
+            downloaded_path = find_downloaded_audio(temp_dir)
+            if downloaded_path:
+                os.replace(downloaded_path, audio_path)
+        
         if os.path.exists(audio_path):
             return audio_path
     except Exception as e:
         logger.warning(f"yt-dlp download failed: {str(e)}")
-        
+    
     # If we get here, the download failed
     raise Exception("yt-dlp download failed to produce audio file")
 
-def download_with_yt_dlp_command(youtube_url, video_id, temp_dir, output_template, audio_path):
+def download_with_yt_dlp_command(youtube_url, video_id, temp_dir, output_template, audio_path, transcode=True, cancel_token=None):
     """Download audio using yt-dlp command line"""
     # Clean up any partial downloads
     if os.path.exists(audio_path):
         os.remove(audio_path)
-        
-    # Set environment variables for SSL
-    os.environ['SSL_CERT_FILE'] = certifi.where()
-    os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
-    os.environ['PYTHONHTTPSVERIFY'] = '0'
-        
+    
     # Construct the command with all possible workarounds
     cmd = [
         "yt-dlp",
@@ -377,15 +3239,25 @@ def download_with_yt_dlp_command(youtube_url, video_id, temp_dir, output_templat
         youtube_url                # YouTube URL
     ]
     
+    if not transcode:
+        # Download the smallest audio stream as is instead of converting to mp3
+        index = cmd.index("--extract-audio")
+        cmd[index:index + 5] = ["--format", TRANSCRIBE_AUDIO_FORMAT]
+    
     try:
         # Run the command
         logger.info(f"Running yt-dlp command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = run_command(cmd, cancel_token)
         
         if result.returncode != 0:
             logger.warning(f"yt-dlp command failed with code {result.returncode}: {result.stderr}")
             raise Exception(f"yt-dlp command failed: {result.stderr}")
         
+        if not transcode:
+            downloaded_path = find_downloaded_audio(temp_dir)
+            if downloaded_path:
+                os.replace(downloaded_path, audio_path)
+        
         if os.path.exists(audio_path):
             return audio_path
     except Exception as e:
@@ -394,34 +3266,33 @@ def download_with_yt_dlp_command(youtube_url, video_id, temp_dir, output_templat
     # If we get here, the download failed
     raise Exception("yt-dlp command did not produce audio file")
 
-def download_with_pytube(youtube_url, video_id, temp_dir, output_template, audio_path):
+def download_with_pytube(youtube_url, video_id, temp_dir, output_template, audio_path, transcode=True, cancel_token=None):
     """Download audio using pytube library"""
-    if YouTube is None:
+    try:
+        from pytube import YouTube
+    except ImportError:
         raise Exception("pytube is not installed")
     
     # Clean up any partial downloads
     if os.path.exists(audio_path):
         os.remove(audio_path)
     
-    # Set environment variables for SSL
-    os.environ['SSL_CERT_FILE'] = certifi.where()
-    os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
-    os.environ['PYTHONHTTPSVERIFY'] = '0'
-    
-    # Configure SSL context
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    ssl._create_default_https_context = lambda: ssl_context
-    
     try:
         logger.info(f"Downloading with pytube: {youtube_url}")
         
+        on_progress = None
+        if cancel_token is not None:
+            # pytube aborts the download when the progress callback raises
+            on_progress = lambda stream, chunk, bytes_remaining: cancel_token.check()
+        
         # Create YouTube object with custom SSL context
-        yt = YouTube(youtube_url)
+        yt = YouTube(youtube_url, on_progress_callback=on_progress)
         
-        # Get the audio stream
-        audio_stream = yt.streams.filter(only_audio=True).first()
+        # Get the audio stream (the smallest one when it won't be transcoded)
+        audio_streams = yt.streams.filter(only_audio=True)
+        if not transcode:
+            audio_streams = audio_streams.order_by('abr')
+        audio_stream = audio_streams.first()
         if not audio_stream:
             raise Exception("No audio stream found")
         
@@ -429,6 +3300,10 @@ def download_with_pytube(youtube_url, video_id, temp_dir, output_template, audio
         temp_audio_path = audio_stream.download(output_path=temp_dir)
         logger.info(f"Downloaded audio to: {temp_audio_path}")
         
+        if not transcode:
+            shutil.move(temp_audio_path, audio_path)
+            return audio_path
+        
         # Convert to mp3 using ffmpeg
         try:
             # Construct ffmpeg command
@@ -445,13 +3320,15 @@ def download_with_pytube(youtube_url, video_id, temp_dir, output_template, audio
             
             # Run ffmpeg
             logger.info(f"Converting to mp3 with ffmpeg: {' '.join(ffmpeg_cmd)}")
-            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+            result = run_command(ffmpeg_cmd, cancel_token)
             
             # Check if conversion was successful
             if result.returncode != 0:
                 logger.warning(f"ffmpeg conversion failed: {result.stderr}")
                 # If conversion failed, just rename the file
                 shutil.move(temp_audio_path, audio_path)
+        except DownloadCancelled:
+            raise
         except Exception as e:
             logger.warning(f"Error converting to mp3: {str(e)}")
             # If conversion failed, just rename the file
@@ -469,7 +3346,7 @@ def download_with_pytube(youtube_url, video_id, temp_dir, output_template, audio
     # If we get here, the download failed
     raise Exception("pytube download failed to produce audio file")
 
-def download_with_requests_direct(youtube_url, video_id, temp_dir, output_template, audio_path):
+def download_with_requests_direct(youtube_url, video_id, temp_dir, output_template, audio_path, transcode=True, cancel_token=None):
     """
     Last resort method: Try to download directly using requests.
     This is unlikely to work for most YouTube videos but included as a last resort.
@@ -485,7 +3362,9 @@ def download_with_requests_direct(youtube_url, video_id, temp_dir, output_templa
     direct_url = f"https://www.youtube.com/get_video_info?video_id={video_id}&el=detailpage"
     
     logger.info(f"Attempting direct download from: {direct_url}")
-    response = requests.get(direct_url, verify=False, timeout=30)
+    response = http_session.get(direct_url, timeout=30)
+    if cancel_token is not None:
+        cancel_token.check()
     
     if response.status_code != 200:
         raise Exception(f"Direct download failed with status code: {response.status_code}")
@@ -510,6 +3389,14 @@ def not_found(error):
 def server_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+startup_timings["configuration"] = round(time.monotonic() - startup_started - startup_timings["imports"], 3)
+if PRELOAD_MODEL:
+    # The janitor thread is started in each worker by init_worker()
+    load_inference_stack()
+else:
+    temp_janitor.start()
+    threading.Thread(target=load_inference_stack, name="startup", daemon=True).start()
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     debug = os.environ.get("FLASK_DEBUG", "0") == "1"
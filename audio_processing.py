@@ -0,0 +1,277 @@
+"""
+Audio helpers for long-audio transcription and voice activity detection.
+
+This module is imported by the chunk transcription worker processes, so it
+must stay light: it does not import app.py, and whisper/torch (through
+inference.py) are only imported inside the worker functions.
+"""
+
+import re
+import numpy as np
+
+# Whisper's input format: 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# Whisper's mel frames per second (hop length of 160 samples at 16 kHz)
+FRAMES_PER_SECOND = 100
+
+def frame_energy(audio, frame_seconds=0.03):
+    """
+    RMS energy of consecutive, non-overlapping frames of audio.
+    
+    Returns:
+        A tuple of (energies, frame_length_in_samples)
+    """
+    frame_length = max(1, int(frame_seconds * SAMPLE_RATE))
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_length
+    frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+    return np.sqrt(np.mean(np.square(frames), axis=1)), frame_length
+
+def find_chunks(audio, chunk_seconds, overlap_seconds, search_seconds=30):
+    """
+    Split audio into chunks of about chunk_seconds, cutting at the quietest
+    point near each target boundary.
+    
+    Every chunk extends overlap_seconds past its cut points on both sides so
+    the model has context around the cut. Stitching assigns each segment to
+    the chunk whose own [cut_start, cut_end) range contains it.
+    
+    Returns:
+        A list of dicts with "start", "end", "cut_start" and "cut_end" sample indices
+    """
+    n_samples = len(audio)
+    chunk_length = int(chunk_seconds * SAMPLE_RATE)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    
+    energy, frame_length = frame_energy(audio)
+    # Smooth over ~0.3s so a single quiet frame inside a word isn't chosen
+    smoothing = max(1, int(0.3 * SAMPLE_RATE / frame_length))
+    if len(energy) >= smoothing:
+        energy = np.convolve(energy, np.ones(smoothing) / smoothing, mode="same")
+    # Keep every chunk at least half the target length
+    search = int(min(search_seconds, chunk_seconds / 2) * SAMPLE_RATE / frame_length)
+    
+    cuts = [0]
+    # Don't leave a tail shorter than half a chunk
+    while n_samples - cuts[-1] > chunk_length * 1.5:
+        target = (cuts[-1] + chunk_length) // frame_length
+        lo = max(target - search, 0)
+        hi = min(target + search, len(energy))
+        if hi <= lo:
+            cut = cuts[-1] + chunk_length
+        else:
+            # Quietest frame in the window; among equally quiet frames
+            # (e.g. digital silence) the one closest to the target
+            window = energy[lo:hi]
+            quietest = np.flatnonzero(window == window.min())
+            cut = (lo + int(quietest[np.argmin(np.abs(quietest + lo - target))])) * frame_length
+        cuts.append(cut)
+    cuts.append(n_samples)
+    
+    return [
+        {
+            "start": max(0, cut_start - overlap),
+            "end": min(n_samples, cut_end + overlap),
+            "cut_start": cut_start,
+            "cut_end": cut_end
+        }
+        for cut_start, cut_end in zip(cuts[:-1], cuts[1:])
+    ]
+
+def _normalize_text(text):
+    return re.sub(r"[^\w]+", " ", text.lower()).strip()
+
+def stitch_segments(chunks, results):
+    """
+    Merge per-chunk transcription results into one result on the global timeline.
+    
+    Segment (and word) timestamps are shifted by the chunk offset. A segment
+    is kept only by the chunk whose cut range contains its midpoint, which
+    removes the duplicates transcribed twice in the overlaps. If the first
+    segment kept from a chunk repeats the text of the last one kept from the
+    previous chunk, it is dropped as well.
+    
+    Args:
+        chunks: Chunks as returned by find_chunks
+        results: Whisper results ({"segments", ...}) in chunk order
+    
+    Returns:
+        A dict with "text" and "segments", like model.transcribe
+    """
+    segments = []
+    for index, (chunk, result) in enumerate(zip(chunks, results)):
+        offset = chunk["start"] / SAMPLE_RATE
+        lo = chunk["cut_start"] / SAMPLE_RATE
+        hi = chunk["cut_end"] / SAMPLE_RATE
+        last_chunk = index == len(chunks) - 1
+        first_kept = True
+        
+        for segment in result["segments"]:
+            start = segment["start"] + offset
+            end = segment["end"] + offset
+            midpoint = (start + end) / 2
+            if midpoint < lo or midpoint > hi or (midpoint == hi and not last_chunk):
+                continue
+            if first_kept and segments and _normalize_text(segments[-1]["text"]) == _normalize_text(segment["text"]):
+                continue
+            first_kept = False
+            
+            segment = dict(segment, start=round(start, 3), end=round(end, 3))
+            segment["seek"] = segment.get("seek", 0) + chunk["start"] * FRAMES_PER_SECOND // SAMPLE_RATE
+            if segment.get("words"):
+                segment["words"] = [
+                    dict(word, start=round(word["start"] + offset, 3), end=round(word["end"] + offset, 3))
+                    for word in segment["words"]
+                ]
+            segments.append(segment)
+    
+    for index, segment in enumerate(segments):
+        segment["id"] = index
+    
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments
+    }
+
+# Model held by each chunk transcription worker process
+_worker_model = None
+_worker_model_key = None
+_worker_device = None
+
+def init_chunk_worker(model_name, device, num_threads, quantize=False):
+    """ProcessPoolExecutor initializer: load the default Whisper model once per worker process."""
+    global _worker_device
+    import torch
+    
+    torch.set_num_threads(num_threads)
+    _worker_device = device
+    _load_worker_model(model_name, quantize)
+
+def _load_worker_model(model_name, quantize):
+    """Replace the worker's model, so at most one copy is held per worker."""
+    global _worker_model, _worker_model_key
+    import inference
+    
+    _worker_model = None
+    _worker_model = inference.load_model(model_name, _worker_device, quantize)
+    _worker_model_key = (model_name, quantize)
+
+def transcribe_chunk(audio, decode_options, model_name=None, quantize=False):
+    """
+    Transcribe one chunk in a worker process, switching models if needed.
+    
+    Decodes like the whisper engine does for whole requests.
+    """
+    import engines
+    
+    if model_name is not None and (model_name, quantize) != _worker_model_key:
+        _load_worker_model(model_name, quantize)
+    result = engines.get_engine("whisper").transcribe(_worker_model, audio, **decode_options)
+    return {"segments": result["segments"], "language": result.get("language")}
+
+def detect_speech(audio, frame_seconds=0.03, margin_db=12.0, min_band_ratio=0.5,
+                  min_speech_seconds=0.25, min_silence_seconds=0.6, padding_seconds=0.2):
+    """
+    Find the speech regions of audio with a cheap energy + spectral test.
+    
+    A frame counts as speech when its energy is margin_db above the noise
+    floor (the 10th percentile of frame energies) and at least min_band_ratio
+    of its spectral energy lies in the 300-3400 Hz voice band, which rejects
+    most music beds and low rumble. Speech runs separated by less than
+    min_silence_seconds are merged, runs shorter than min_speech_seconds are
+    dropped and every region is padded by padding_seconds.
+    
+    Returns:
+        A list of (start, end) sample indices, sorted and non-overlapping
+    """
+    energy, frame_length = frame_energy(audio, frame_seconds)
+    if len(energy) == 0:
+        return []
+    
+    energy_db = 20 * np.log10(energy + 1e-10)
+    threshold = max(np.percentile(energy_db, 10) + margin_db, -50.0)
+    loud = energy_db > threshold
+    
+    # Voice-band energy ratio, computed in blocks to bound memory on long audio
+    frequencies = np.fft.rfftfreq(frame_length, 1 / SAMPLE_RATE)
+    voice_band = (frequencies >= 300) & (frequencies <= 3400)
+    window = np.hanning(frame_length).astype(np.float32)
+    band_ratio = np.zeros(len(energy), dtype=np.float32)
+    block = 8192
+    for first in range(0, len(energy), block):
+        frames = audio[first * frame_length:min(first + block, len(energy)) * frame_length]
+        frames = frames.reshape(-1, frame_length) * window
+        power = np.square(np.abs(np.fft.rfft(frames, axis=1)))
+        band_ratio[first:first + len(frames)] = power[:, voice_band].sum(axis=1) / (power.sum(axis=1) + 1e-10)
+    
+    speech = loud & (band_ratio >= min_band_ratio)
+    
+    # Run boundaries as frame indices: starts[i] <= frames < ends[i]
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    frames_per_second = SAMPLE_RATE / frame_length
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < min_silence_seconds * frames_per_second:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    
+    padding = int(padding_seconds * SAMPLE_RATE)
+    result = []
+    for start, end in regions:
+        if (end - start) < min_speech_seconds * frames_per_second:
+            continue
+        start = max(0, int(start) * frame_length - padding)
+        end = min(len(audio), int(end) * frame_length + padding)
+        if result and start <= result[-1][1]:
+            result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+def compress_speech(audio, regions, gap_seconds=0.3):
+    """
+    Concatenate the speech regions of audio, separated by short silences.
+    
+    Returns:
+        A tuple of (compressed_audio, timeline), where timeline is a list of
+        (compressed_start, original_start, duration) tuples in seconds
+    """
+    gap = np.zeros(int(gap_seconds * SAMPLE_RATE), dtype=np.float32)
+    pieces = []
+    timeline = []
+    position = 0
+    for start, end in regions:
+        if pieces:
+            pieces.append(gap)
+            position += len(gap)
+        pieces.append(audio[start:end])
+        timeline.append((position / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE))
+        position += end - start
+    
+    if not pieces:
+        return np.zeros(0, dtype=np.float32), timeline
+    return np.concatenate(pieces), timeline
+
+def to_original_time(seconds, timeline):
+    """Map a timestamp on the compressed timeline back to the original audio."""
+    compressed_starts = [entry[0] for entry in timeline]
+    index = max(0, int(np.searchsorted(compressed_starts, seconds, side="right")) - 1)
+    compressed_start, original_start, duration = timeline[index]
+    # Timestamps inside the inserted gaps snap to the end of the region before
+    return round(float(original_start + min(max(seconds - compressed_start, 0.0), duration)), 3)
+
+def remap_segments(segments, timeline):
+    """Map segment and word timestamps from the compressed timeline back, in place."""
+    for segment in segments:
+        segment["start"] = to_original_time(segment["start"], timeline)
+        segment["end"] = to_original_time(segment["end"], timeline)
+        for word in segment.get("words") or []:
+            word["start"] = to_original_time(word["start"], timeline)
+            word["end"] = to_original_time(word["end"], timeline)
+    return segments
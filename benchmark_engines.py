@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark the transcription engines (see engines.py) on local audio.
+
+Loads the same model on each engine, transcribes every audio file of a
+fixture directory and reports load time, wall time, CPU time, real-time
+factor and word error rate (WER). Fixtures with a reference transcript next
+to them (same name, .txt extension) are scored against it; otherwise each
+engine is scored against the first one.
+
+Example:
+    python benchmark_engines.py fixtures/ --model base --engines whisper,faster-whisper,onnx --threads 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from compare_quantization import find_fixtures, word_error_rate
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare transcription engines on local audio fixtures")
+    parser.add_argument("fixtures", nargs="?", default="fixtures", help="Directory with audio files and optional .txt references")
+    parser.add_argument("--engines", default="whisper,faster-whisper,onnx", help="Comma-separated engines to compare")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL", "base"), help="Whisper model size or local model path")
+    parser.add_argument("--language", default=None, help="Language of the fixtures (detected when omitted)")
+    parser.add_argument("--quantize", action="store_true", help="Use INT8 weights on the engines that support it")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per engine (default: each runtime's own choice)")
+    parser.add_argument("--device", default="cpu", help="Inference device (default: cpu)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    
+    import torch
+    import whisper
+    from whisper.normalizers import BasicTextNormalizer
+    import engines
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    fixtures = find_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No audio files found in {args.fixtures}")
+        return 1
+    audios = [(os.path.basename(path), whisper.load_audio(path), reference) for path, reference in fixtures]
+    total_duration = sum(len(audio) for _, audio, _ in audios) / whisper.audio.SAMPLE_RATE
+    
+    normalizer = BasicTextNormalizer()
+    options = {"task": "transcribe", "language": args.language, "fp16": args.device != "cpu"}
+    
+    results = {}
+    for name in [name.strip() for name in args.engines.split(",") if name.strip()]:
+        engine = engines.get_engine(name)
+        if not engine.available():
+            print(f"{name}: not installed ({engine.install_hint}), skipped")
+            continue
+        quantize = args.quantize and engine.can_quantize(args.device)
+        
+        print(f"{name}: loading {args.model}{' (int8)' if quantize else ''}...")
+        started = time.perf_counter()
+        try:
+            model = engine.load(args.model, args.device, quantize, args.threads)
+        except Exception as e:
+            print(f"{name}: could not load the model: {e}")
+            continue
+        load_seconds = time.perf_counter() - started
+        
+        rows = []
+        for file_name, audio, reference in audios:
+            wall_started = time.perf_counter()
+            cpu_started = time.process_time()
+            result = engine.transcribe(model, audio, **options)
+            row = {
+                "file": file_name,
+                "text": result["text"],
+                "segments": len(result["segments"]),
+                "wall_seconds": time.perf_counter() - wall_started,
+                "cpu_seconds": time.process_time() - cpu_started
+            }
+            if reference is not None:
+                row["wer"] = word_error_rate(reference, result["text"], normalizer)
+            rows.append(row)
+            print(f"  {file_name}: {row['wall_seconds']:.1f}s wall, {row['cpu_seconds']:.1f}s cpu, {row['segments']} segments")
+        
+        results[name] = {
+            "quantized": quantize,
+            "load_seconds": round(load_seconds, 2),
+            "memory_mb": round(engine.memory_bytes(model, args.model, quantize) / 1024 / 1024, 1),
+            "wall_seconds": round(sum(row["wall_seconds"] for row in rows), 2),
+            "cpu_seconds": round(sum(row["cpu_seconds"] for row in rows), 2),
+            "real_time_factor": round(sum(row["wall_seconds"] for row in rows) / max(total_duration, 1e-9), 3),
+            "fixtures": rows
+        }
+        del model
+    
+    if not results:
+        print("No engine could be benchmarked")
+        return 1
+    
+    # Without references, score every engine against the first one
+    baseline = next(iter(results))
+    for name, result in results.items():
+        scored = [row["wer"] for row in result["fixtures"] if "wer" in row]
+        if scored:
+            result["mean_wer"] = round(sum(scored) / len(scored), 4)
+        if name != baseline:
+            result[f"wer_vs_{baseline}"] = round(sum(
+                word_error_rate(base_row["text"], row["text"], normalizer)
+                for base_row, row in zip(results[baseline]["fixtures"], result["fixtures"])
+            ) / len(result["fixtures"]), 4)
+    
+    print(f"\n{len(audios)} fixture(s), {total_duration:.1f}s of audio, model {args.model}")
+    print(f"{'engine':<16}{'load s':>8}{'wall s':>9}{'cpu s':>9}{'RTF':>8}{'MB':>9}  WER")
+    for name, result in results.items():
+        wer = result.get("mean_wer", result.get(f"wer_vs_{baseline}"))
+        wer_text = "-" if wer is None else f"{wer:.1%}" + ("" if "mean_wer" in result else f" vs {baseline}")
+        print(
+            f"{name:<16}{result['load_seconds']:>8.1f}{result['wall_seconds']:>9.1f}{result['cpu_seconds']:>9.1f}"
+            f"{result['real_time_factor']:>8.3f}{result['memory_mb']:>9.1f}  {wer_text}"
+        )
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "audio_seconds": total_duration, "engines": results}, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compare full-precision and INT8-quantized Whisper inference on local audio.
+
+Transcribes every audio file of a fixture directory with both variants of a
+model and reports wall time, CPU time and word error rate (WER). When a
+fixture has a reference transcript next to it (same name, .txt extension),
+both variants are scored against it; otherwise the quantized output is
+scored against the full-precision output.
+
+Example:
+    python compare_quantization.py fixtures/ --model base --language pt
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac", ".opus")
+
+def find_fixtures(directory):
+    """Audio files of the fixture directory, with their reference transcript (or None)."""
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        reference_path = os.path.join(directory, os.path.splitext(name)[0] + ".txt")
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read()
+        fixtures.append((os.path.join(directory, name), reference))
+    return fixtures
+
+def word_error_rate(reference, hypothesis, normalizer):
+    """Word-level edit distance divided by the number of reference words."""
+    reference_words = normalizer(reference).split()
+    hypothesis_words = normalizer(hypothesis).split()
+    if not reference_words:
+        return 0.0 if not hypothesis_words else 1.0
+    
+    previous = list(range(len(hypothesis_words) + 1))
+    for i, reference_word in enumerate(reference_words, 1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis_words, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (reference_word != hypothesis_word)
+            ))
+        previous = current
+    return previous[-1] / len(reference_words)
+
+def transcribe_timed(model, audio, options):
+    """
+    Transcribe audio like the API's whisper engine, returning the text with
+    wall and CPU seconds.
+    """
+    import engines
+    
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = engines.get_engine("whisper").transcribe(model, audio, **options)
+    return result["text"], time.perf_counter() - wall_started, time.process_time() - cpu_started
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-precision and INT8-quantized Whisper on local audio fixtures")
+    parser.add_argument("fixtures", nargs="?", default="fixtures", help="Directory with audio files and optional .txt references")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL", "base"), help="Whisper model name or checkpoint path")
+    parser.add_argument("--language", default=None, help="Language of the fixtures (detected when omitted)")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (default: torch's own choice)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    
+    import torch
+    import whisper
+    from whisper.normalizers import BasicTextNormalizer
+    import inference
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    fixtures = find_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No audio files found in {args.fixtures}")
+        return 1
+    
+    normalizer = BasicTextNormalizer()
+    options = {"fp16": False, "language": args.language, "task": "transcribe"}
+    
+    print(f"Loading {args.model} (fp32 and int8)...")
+    variants = {}
+    for label, quantize in (("fp32", False), ("int8", True)):
+        model = inference.load_model(args.model, "cpu", quantize)
+        variants[label] = {"model": model, "memory_mb": inference.model_memory_bytes(model) / 1024 / 1024}
+    
+    rows = []
+    for path, reference in fixtures:
+        audio = whisper.load_audio(path)
+        row = {"file": os.path.basename(path), "duration": len(audio) / whisper.audio.SAMPLE_RATE}
+        for label, variant in variants.items():
+            text, wall, cpu = transcribe_timed(variant["model"], audio, options)
+            row[label] = {"text": text, "wall_seconds": wall, "cpu_seconds": cpu}
+        
+        if reference is not None:
+            row["fp32"]["wer"] = word_error_rate(reference, row["fp32"]["text"], normalizer)
+            row["int8"]["wer"] = word_error_rate(reference, row["int8"]["text"], normalizer)
+        # Difference between the variants, useful without references too
+        row["int8_vs_fp32_wer"] = word_error_rate(row["fp32"]["text"], row["int8"]["text"], normalizer)
+        rows.append(row)
+        
+        print(
+            f"{row['file']}: {row['duration']:.1f}s audio | "
+            f"fp32 {row['fp32']['cpu_seconds']:.1f}s cpu, int8 {row['int8']['cpu_seconds']:.1f}s cpu | "
+            f"int8 vs fp32 WER {row['int8_vs_fp32_wer']:.1%}"
+            + (f" | WER fp32 {row['fp32']['wer']:.1%}, int8 {row['int8']['wer']:.1%}" if reference is not None else "")
+        )
+    
+    summary = {"model": args.model, "fixtures": len(rows)}
+    for label, variant in variants.items():
+        summary[label] = {
+            "memory_mb": round(variant["memory_mb"], 1),
+            "wall_seconds": round(sum(row[label]["wall_seconds"] for row in rows), 2),
+            "cpu_seconds": round(sum(row[label]["cpu_seconds"] for row in rows), 2)
+        }
+        scored = [row[label]["wer"] for row in rows if "wer" in row[label]]
+        if scored:
+            summary[label]["mean_wer"] = round(sum(scored) / len(scored), 4)
+    summary["cpu_time_reduction"] = round(1 - summary["int8"]["cpu_seconds"] / max(summary["fp32"]["cpu_seconds"], 1e-9), 4)
+    summary["mean_int8_vs_fp32_wer"] = round(sum(row["int8_vs_fp32_wer"] for row in rows) / len(rows), 4)
+    
+    print("\nSummary:")
+    print(json.dumps(summary, indent=2))
+    
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "fixtures": rows}, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+CPU runtime configuration for inference workers.
+
+Each gunicorn worker runs torch on its own. Left alone, every worker starts
+as many intra-op threads as the machine has cores, so several workers in a
+container limited to a couple of CPUs oversubscribe it and thrash. The
+functions here split the CPUs the container may actually use (its cgroup
+quota and affinity mask) between the workers, and optionally pin each
+worker to its own cores.
+"""
+
+import os
+import sys
+
+# cgroup v2 exposes the quota in one file, v1 in two
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_DIRS = ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct")
+CGROUP_V2_CPU_STAT = "/sys/fs/cgroup/cpu.stat"
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def cgroup_cpu_quota():
+    """
+    The container's CPU quota in CPUs (e.g. 2.0 for cpus: "2").
+    
+    Returns:
+        The quota, or None when the cgroup has no limit or can't be read
+    """
+    try:
+        quota, period = _read(CGROUP_V2_CPU_MAX).split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    
+    for directory in CGROUP_V1_CPU_DIRS:
+        try:
+            quota = int(_read(os.path.join(directory, "cpu.cfs_quota_us")))
+            period = int(_read(os.path.join(directory, "cpu.cfs_period_us")))
+        except (OSError, ValueError):
+            continue
+        return quota / period if quota > 0 and period > 0 else None
+    return None
+
+def affinity_cpus():
+    """The CPUs this process may run on, in order."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+def available_cpus():
+    """Number of CPUs the container can use: its affinity mask, capped by the cgroup quota."""
+    cpus = len(affinity_cpus())
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return cpus
+
+def plan(workers, slot, threads=0, interop_threads=0, pin=False):
+    """
+    Decide the torch thread counts and cores of one worker.
+    
+    Args:
+        workers: Number of inference worker processes sharing the container
+        slot: This worker's index, 0 <= slot < workers
+        threads: Intra-op threads, or 0 to split the available CPUs evenly
+        interop_threads: Inter-op threads, or 0 for 1
+        pin: Whether to pin the worker to its own cores
+    
+    Returns:
+        A dict with "threads", "interop_threads" and "cpus" (None when not pinning)
+    """
+    workers = max(1, workers)
+    share = max(1, available_cpus() // workers)
+    cpus = None
+    if pin:
+        allowed = affinity_cpus()
+        # Disjoint blocks while there are enough cores; wrap around otherwise
+        start = (slot * share) % len(allowed)
+        cpus = [allowed[(start + i) % len(allowed)] for i in range(min(share, len(allowed)))]
+    return {
+        "threads": threads or share,
+        "interop_threads": interop_threads or 1,
+        "cpus": cpus
+    }
+
+def apply(config):
+    """
+    Apply a plan to this process: pin every thread to config["cpus"] and set
+    torch's thread counts.
+    
+    Returns:
+        A list of warnings for settings that could not be applied
+    """
+    import torch
+    
+    warnings = []
+    if config["cpus"]:
+        # sched_setaffinity applies to a single thread; threads created later
+        # inherit the mask from the thread that creates them
+        for tid in os.listdir("/proc/self/task"):
+            try:
+                os.sched_setaffinity(int(tid), config["cpus"])
+            except OSError as e:
+                warnings.append(f"affinity of thread {tid}: {e}")
+    
+    torch.set_num_threads(config["threads"])
+    try:
+        torch.set_num_interop_threads(config["interop_threads"])
+    except RuntimeError as e:
+        # Can only be set before the inter-op pool is first used
+        warnings.append(f"interop threads: {e}")
+    return warnings
+
+def scheduling_stats():
+    """
+    Scheduler statistics of this process and its cgroup.
+    
+    cgroup throttling shows the container hitting its CPU quota; a high share
+    of involuntary context switches shows threads competing for the CPUs.
+    """
+    stats = {"available_cpus": available_cpus(), "cgroup_quota": cgroup_cpu_quota(), "affinity": affinity_cpus()}
+    
+    # Only once the startup thread has imported it
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        stats["torch_threads"] = torch.get_num_threads()
+        stats["torch_interop_threads"] = torch.get_num_interop_threads()
+    
+    # Summed over the process's threads: on-CPU time, runqueue wait,
+    # timeslices and context switches
+    totals = dict.fromkeys(("run_ns", "wait_ns", "timeslices", "voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"), 0)
+    try:
+        tids = os.listdir("/proc/self/task")
+    except OSError:
+        tids = []
+    for tid in tids:
+        try:
+            run_ns, wait_ns, timeslices = _read(f"/proc/self/task/{tid}/schedstat").split()[:3]
+            totals["run_ns"] += int(run_ns)
+            totals["wait_ns"] += int(wait_ns)
+            totals["timeslices"] += int(timeslices)
+            for line in _read(f"/proc/self/task/{tid}/status").splitlines():
+                name, _, value = line.partition(":")
+                if name in ("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"):
+                    totals[name] += int(value)
+        except (OSError, ValueError):
+            continue
+    if tids:
+        stats["threads"] = len(tids)
+        stats["schedstat"] = {
+            "run_seconds": round(totals["run_ns"] / 1e9, 3),
+            "runqueue_wait_seconds": round(totals["wait_ns"] / 1e9, 3),
+            "timeslices": totals["timeslices"]
+        }
+        stats["context_switches"] = {
+            "voluntary": totals["voluntary_ctxt_switches"],
+            "involuntary": totals["nonvoluntary_ctxt_switches"]
+        }
+    
+    for path in [CGROUP_V2_CPU_STAT] + [os.path.join(directory, "cpu.stat") for directory in CGROUP_V1_CPU_DIRS]:
+        try:
+            cpu_stat = dict(line.split() for line in _read(path).splitlines())
+        except (OSError, ValueError):
+            continue
+        stats["cgroup_throttling"] = {
+            "periods": int(cpu_stat.get("nr_periods", 0)),
+            "throttled_periods": int(cpu_stat.get("nr_throttled", 0)),
+            # v2 reports microseconds, v1 nanoseconds
+            "throttled_seconds": round(
+                int(cpu_stat["throttled_usec"]) / 1e6 if "throttled_usec" in cpu_stat
+                else int(cpu_stat.get("throttled_time", 0)) / 1e9, 3
+            )
+        }
+        break
+    
+    return stats
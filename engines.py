@@ -0,0 +1,296 @@
+"""
+Transcription engines: the runtimes that turn audio into segments.
+
+The default engine is openai-whisper on torch. The others run the same
+Whisper models on faster CPU runtimes:
+
+- faster-whisper: CTranslate2 (pip install faster-whisper), with INT8
+  weights when quantized
+- onnx: models exported to ONNX and run with ONNX Runtime through
+  Hugging Face Optimum (pip install "optimum[onnxruntime]" transformers)
+
+Every engine returns the same {"text", "segments", "language"} dict as
+whisper's model.transcribe, with the same keys in each segment, so the rest
+of the pipeline (VAD remapping, caching, the API responses) doesn't depend
+on the engine. Engines are stateless; the loaded models are kept by
+inference.ModelRegistry.
+"""
+
+import os
+import zlib
+import importlib.util
+
+# Whisper model sizes, as published on the Hugging Face hub
+HUB_MODEL_PREFIX = "openai/whisper-"
+
+class TranscriptionEngine:
+    """
+    Base class of the transcription engines.
+    
+    Subclasses implement load() and transcribe(); the other methods have
+    defaults that fit most runtimes.
+    """
+    
+    name = None
+    # Module that must be importable for the engine to be available
+    package = None
+    install_hint = None
+    # Whether windows can be batched across requests (inference.InferenceBatcher)
+    supports_batching = False
+    # Whether long audio can be split between the long-audio worker processes
+    supports_long_audio = False
+    # Whether a model loaded before gunicorn forks keeps working in the workers
+    fork_safe = False
+    
+    def available(self):
+        """Whether the engine's runtime is installed."""
+        return importlib.util.find_spec(self.package) is not None
+    
+    def can_quantize(self, device):
+        """Whether the engine can run INT8-quantized models on device."""
+        return False
+    
+    def load(self, model_name, device, quantize=False, threads=0):
+        """
+        Load a model.
+        
+        Args:
+            model_name: A Whisper model size ("base") or a local model path
+            device: "cpu" or "cuda"
+            quantize: Load INT8 weights
+            threads: CPU threads for the runtime, or 0 for its default
+        """
+        raise NotImplementedError
+    
+    def transcribe(self, model, audio, task="transcribe", language=None, fp16=False, segment_callback=None):
+        """
+        Transcribe 16 kHz mono float32 audio.
+        
+        Args:
+            segment_callback: Optional callable(segments, progress) called
+                with new segments as they are decoded. Engines that can't
+                stream call it once with every segment.
+        
+        Returns:
+            A dict with "text", "segments" and "language", like whisper's model.transcribe
+        """
+        raise NotImplementedError
+    
+    def estimate_bytes(self, model_name, quantize=False):
+        """Memory a model is expected to need before it is loaded (0 if unknown)."""
+        import inference
+        
+        size = inference.estimate_model_bytes(model_name)
+        return size // 4 if quantize else size
+    
+    def memory_bytes(self, model, model_name, quantize=False):
+        """Memory held by a loaded model; the estimate unless the engine can measure it."""
+        return self.estimate_bytes(model_name, quantize)
+
+class WhisperEngine(TranscriptionEngine):
+    """openai-whisper on torch, the default engine."""
+    
+    name = "whisper"
+    package = "whisper"
+    install_hint = "pip install openai-whisper"
+    supports_batching = True
+    supports_long_audio = True
+    fork_safe = True
+    
+    def can_quantize(self, device):
+        return device == "cpu"
+    
+    def load(self, model_name, device, quantize=False, threads=0):
+        # torch's thread count is process-wide and set by cpu_runtime
+        import inference
+        
+        return inference.load_model(model_name, device, quantize)
+    
+    def transcribe(self, model, audio, task="transcribe", language=None, fp16=False, segment_callback=None):
+        # model.transcribe has no per-window hook: run the window loop of
+        # batched inference instead, one window at a time and conditioned on
+        # the previous text, which gives model.transcribe's result. It runs
+        # with or without a callback, so streamed and plain requests (which
+        # share the cache) decode the same way.
+        import inference
+        
+        return inference.transcribe(inference.DirectDecoder(model), audio, task, language, fp16, segment_callback)
+    
+    def estimate_bytes(self, model_name, quantize=False):
+        # Quantized models are loaded in full precision first
+        import inference
+        
+        return inference.estimate_model_bytes(model_name)
+    
+    def memory_bytes(self, model, model_name, quantize=False):
+        import inference
+        
+        return inference.model_memory_bytes(model)
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """
+    CTranslate2 through faster-whisper.
+    
+    Model sizes are downloaded in CTranslate2 format on first use; a local
+    path must point to a converted model (ct2-transformers-converter).
+    """
+    
+    name = "faster-whisper"
+    package = "faster_whisper"
+    install_hint = "pip install faster-whisper"
+    
+    def can_quantize(self, device):
+        return True
+    
+    def load(self, model_name, device, quantize=False, threads=0):
+        from faster_whisper import WhisperModel
+        
+        if quantize:
+            compute_type = "int8" if device == "cpu" else "int8_float16"
+        else:
+            compute_type = "float32" if device == "cpu" else "float16"
+        return WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=threads)
+    
+    def transcribe(self, model, audio, task="transcribe", language=None, fp16=False, segment_callback=None):
+        # Greedy decoding with temperature fallback, like whisper's
+        # model.transcribe (faster-whisper defaults to a beam of 5).
+        # Segments are decoded lazily as the generator is consumed.
+        generator, info = model.transcribe(audio, task=task, language=language, beam_size=1, best_of=1)
+        segments = []
+        for index, segment in enumerate(generator):
+            segments.append({
+                "id": index,
+                "seek": segment.seek,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "tokens": list(segment.tokens),
+                "temperature": segment.temperature,
+                "avg_logprob": segment.avg_logprob,
+                "compression_ratio": segment.compression_ratio,
+                "no_speech_prob": segment.no_speech_prob
+            })
+            if segment_callback:
+                segment_callback(segments[-1:], min(segment.end / max(info.duration, 1e-9), 1.0))
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": info.language
+        }
+
+class OnnxEngine(TranscriptionEngine):
+    """
+    ONNX Runtime through Hugging Face Optimum.
+    
+    Model sizes are exported from the Hugging Face hub checkpoints on first
+    load; a local path must point to an Optimum ONNX export
+    (optimum-cli export onnx --model openai/whisper-base whisper-base-onnx).
+    Quantized models have to be exported quantized, so quantize is not
+    supported.
+    """
+    
+    name = "onnx"
+    package = "optimum.onnxruntime"
+    install_hint = "pip install \"optimum[onnxruntime]\" transformers"
+    
+    def available(self):
+        try:
+            return importlib.util.find_spec(self.package) is not None
+        except ModuleNotFoundError:
+            return False  # optimum itself is missing
+    
+    def load(self, model_name, device, quantize=False, threads=0):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import AutoProcessor, pipeline
+        
+        if quantize:
+            raise ValueError("The onnx engine doesn't quantize models; export a quantized model instead")
+        
+        exported = os.path.isdir(model_name)
+        model_id = model_name if exported else HUB_MODEL_PREFIX + model_name
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(
+            model_id,
+            export=not exported,
+            provider="CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider",
+            session_options=session_options
+        )
+        processor = AutoProcessor.from_pretrained(model_id)
+        return pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            chunk_length_s=30
+        )
+    
+    def transcribe(self, model, audio, task="transcribe", language=None, fp16=False, segment_callback=None):
+        generate_kwargs = {"task": task}
+        if language:
+            generate_kwargs["language"] = language
+        output = model(
+            audio.copy(),
+            return_timestamps=True,
+            return_language=True,
+            generate_kwargs=generate_kwargs
+        )
+        
+        duration = len(audio) / 16000
+        tokenizer = model.tokenizer
+        segments = []
+        for chunk in output.get("chunks", []):
+            start, end = chunk["timestamp"]
+            start = start or 0.0
+            # The last chunk has no end when the audio ends mid-sentence
+            end = end if end is not None else duration
+            text = chunk["text"]
+            segments.append({
+                "id": len(segments),
+                "seek": int(start * 100),
+                "start": start,
+                "end": end,
+                "text": text,
+                "tokens": tokenizer.encode(text, add_special_tokens=False),
+                # The pipeline doesn't expose the decoding statistics
+                "temperature": 0.0,
+                "avg_logprob": None,
+                "compression_ratio": compression_ratio(text),
+                "no_speech_prob": None
+            })
+        
+        if segment_callback:
+            segment_callback(segments, 1.0)
+        
+        detected = next((chunk.get("language") for chunk in output.get("chunks", []) if chunk.get("language")), None)
+        return {
+            "text": output["text"],
+            "segments": segments,
+            "language": language or detected
+        }
+
+def compression_ratio(text):
+    """gzip compression ratio of a text, as whisper computes it for each segment."""
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+ENGINES = {engine.name: engine for engine in (WhisperEngine(), FasterWhisperEngine(), OnnxEngine())}
+
+def get_engine(name):
+    """
+    The engine registered under name.
+    
+    Raises:
+        ValueError: If there is no such engine
+    """
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"engine must be one of: {', '.join(ENGINES)}")
+    return engine
+
+def status():
+    """Availability of each engine, for the health and stats endpoints."""
+    return {name: engine.available() for name, engine in ENGINES.items()}
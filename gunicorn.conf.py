@@ -0,0 +1,42 @@
+# Gunicorn configuration for the YouTube Transcription and Download API
+#
+# Command line options override these settings, e.g.:
+#   gunicorn --config gunicorn.conf.py --workers=4 app:app
+
+import os
+import gc
+import itertools
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+# Threads per worker (the gthread worker class when above 1). The worker
+# keeps reporting to the master while its threads serve long transcriptions
+# and streaming responses, so those aren't killed after `timeout` seconds.
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# With PRELOAD_MODEL=1 the app, and with it the default Whisper model, is
+# loaded once in the master; forked workers share the weights copy-on-write
+# instead of each loading their own copy
+preload_app = os.environ.get("PRELOAD_MODEL", "0") == "1"
+
+def when_ready(server):
+    if preload_app:
+        # Move everything loaded so far out of the garbage collector's reach,
+        # so collections in the workers don't write to (and copy) shared pages
+        gc.freeze()
+        server.log.info(f"Preloaded app; {gc.get_freeze_count()} objects frozen before forking workers")
+
+def pre_fork(server, worker):
+    # Give each worker a distinct slot (reusing those of exited workers) so
+    # the app can split the CPUs between workers, see cpu_runtime.py. The
+    # forked worker inherits these variables.
+    used = {getattr(other, "cpu_slot", None) for other in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in itertools.count() if slot not in used)
+    os.environ["WORKER_SLOT"] = str(worker.cpu_slot)
+    os.environ["WORKER_COUNT"] = str(server.num_workers)
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        app.init_worker()
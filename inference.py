@@ -0,0 +1,580 @@
+"""
+Whisper model registry and batched inference shared by concurrent transcriptions.
+
+ModelRegistry loads the Whisper models requests ask for on first use, with
+the transcription engine they ask for (see engines.py), and evicts the
+least recently used ones when a memory budget is exceeded.
+
+Each transcription walks its audio in 30-second windows like
+whisper.transcribe. Windows are decoded either on their own by a
+DirectDecoder, conditioned on the previous window's text exactly like
+whisper.transcribe, or by an InferenceBatcher. The batcher groups windows
+from concurrent requests that use the same decoding options and runs them
+through the encoder and decoder as one batch, then routes each result
+back to the request that submitted it; batched windows are not
+conditioned on the previous text, since each request's prompt differs.
+
+torch and whisper are imported on first use, so importing this module
+doesn't slow down application startup.
+"""
+
+import os
+import gc
+import logging
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future
+import engines
+
+# whisper.transcribe's defaults
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+# Approximate parameter counts, used to make room before loading a model
+MODEL_PARAMETERS = {
+    "tiny": 39e6,
+    "base": 74e6,
+    "small": 244e6,
+    "medium": 769e6,
+    "large": 1550e6,
+    "turbo": 809e6
+}
+
+logger = logging.getLogger(__name__)
+
+def default_device():
+    """The inference device: "cuda" when available, otherwise "cpu"."""
+    import torch
+    
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def model_memory_bytes(model):
+    """Memory held by a model's weights, including packed quantized weights."""
+    import torch
+    
+    def tensor_bytes(value):
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(tensor_bytes(item) for item in value)
+        return 0
+    
+    return sum(tensor_bytes(value) for value in model.state_dict().values())
+
+def quantize_model(model):
+    """
+    Apply dynamic INT8 quantization to the Linear layers of a Whisper model, in place.
+    
+    Linear weights are stored as int8 and activations are quantized on the
+    fly, which cuts CPU time and memory for a small accuracy loss. CPU only.
+    """
+    import torch
+    from torch import nn
+    
+    # whisper's Linear subclass only casts the weights to the input dtype (a
+    # no-op in fp32), and quantize_dynamic only converts exact nn.Linear
+    for module in model.modules():
+        if isinstance(module, nn.Linear) and type(module) is not nn.Linear:
+            module.__class__ = nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def load_model(name, device=None, quantize=False):
+    """
+    Load a Whisper model by name or checkpoint path, optionally INT8-quantized.
+    
+    Raises:
+        ValueError: If quantization is requested on a non-CPU device
+    """
+    import whisper
+    
+    device = device or default_device()
+    if quantize and device != "cpu":
+        raise ValueError("INT8 quantization is only supported on CPU")
+    model = whisper.load_model(name, device=device)
+    if quantize:
+        model = quantize_model(model)
+    return model
+
+def registry_key(name, quantize=False, engine="whisper"):
+    """
+    Registry key of a model variant: the model name, prefixed with the
+    engine unless it's the default one and with ":int8" when quantized.
+    """
+    key = name if engine == "whisper" else f"{engine}/{name}"
+    return f"{key}:int8" if quantize else key
+
+def estimate_model_bytes(name):
+    """Memory a model is expected to need before it is loaded (0 if unknown)."""
+    if os.path.isfile(name):
+        return os.path.getsize(name)
+    base_name = name.split(".")[0].split("-")[0]
+    return int(MODEL_PARAMETERS.get(base_name, 0) * 4)
+
+class ModelEntry:
+    """A registry slot for one model variant, loaded or not."""
+    
+    def __init__(self, name, model_name=None, quantize=False, engine=None):
+        self.name = name
+        self.model_name = model_name or name
+        self.quantize = quantize
+        self.engine = engine or engines.get_engine("whisper")
+        self.model = None
+        self.batcher = None
+        self.batcher_pid = None
+        self.load_lock = threading.Lock()
+        self.in_use = 0
+        self.uses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.memory_bytes = 0
+        self.load_seconds = None
+        self.last_used = None
+
+class ModelRegistry:
+    """
+    Whisper models by name, loaded lazily and evicted in LRU order.
+    
+    Models in use are never evicted, so the budget can be exceeded
+    temporarily when every loaded model is busy.
+    """
+    
+    def __init__(self, allowed, memory_budget, device=None, batch_size=0, batch_wait=0.05):
+        self.device = device
+        self.allowed = list(allowed)
+        self.memory_budget = memory_budget
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        # CPU threads for engines that run their own thread pool (0: their default)
+        self.threads = 0
+        self._entries = OrderedDict()  # name -> ModelEntry, least recently used first
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def use(self, name, quantize=False, engine="whisper"):
+        """
+        Context manager yielding the loaded ModelEntry for name (its INT8
+        variant with quantize) on the given engine, loading it if needed and
+        keeping it from being evicted until the block exits.
+        """
+        if name not in self.allowed:
+            raise ValueError(f"model must be one of: {', '.join(self.allowed)}")
+        
+        key = registry_key(name, quantize, engine)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = ModelEntry(key, name, quantize, engines.get_engine(engine))
+            self._entries.move_to_end(key)
+            entry.in_use += 1
+            entry.uses += 1
+            entry.last_used = time.time()
+        
+        try:
+            with entry.load_lock:
+                if entry.model is None:
+                    self._load(entry)
+                # Started lazily in the process that uses it: a model loaded
+                # before a fork doesn't bring its batching thread along
+                if self.batch_size > 1 and entry.engine.supports_batching and (entry.batcher is None or entry.batcher_pid != os.getpid()):
+                    entry.batcher = InferenceBatcher(entry.model, self.batch_size, self.batch_wait)
+                    entry.batcher_pid = os.getpid()
+            yield entry
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+            # Models kept loaded over budget while they were busy can go now
+            self._evict(0, keep=entry)
+    
+    def _load(self, entry):
+        self._evict(entry.engine.estimate_bytes(entry.model_name, entry.quantize), keep=entry)
+        
+        logger.info(f"Loading Whisper model: {entry.name}")
+        started = time.monotonic()
+        model = entry.engine.load(entry.model_name, self.device or default_device(), entry.quantize, self.threads)
+        elapsed = time.monotonic() - started
+        logger.info(f"Whisper model {entry.name} loaded in {elapsed:.1f}s")
+        
+        with self._lock:
+            entry.model = model
+            entry.memory_bytes = entry.engine.memory_bytes(model, entry.model_name, entry.quantize)
+            entry.load_seconds = round(elapsed, 3)
+            entry.loads += 1
+        
+        self._evict(0, keep=entry)
+    
+    def _evict(self, needed, keep):
+        """Unload idle models, least recently used first, until needed more bytes fit the budget."""
+        if self.memory_budget <= 0:
+            return
+        
+        evicted = []
+        with self._lock:
+            while True:
+                loaded = [entry for entry in self._entries.values() if entry.model is not None]
+                if sum(entry.memory_bytes for entry in loaded) + needed <= self.memory_budget:
+                    break
+                idle = [entry for entry in loaded if entry.in_use == 0 and entry is not keep]
+                if not idle:
+                    logger.warning("Model memory budget exceeded but every loaded model is in use")
+                    break
+                victim = idle[0]
+                if victim.batcher is not None:
+                    victim.batcher.close()
+                victim.model = None
+                victim.batcher = None
+                victim.memory_bytes = 0
+                victim.evictions += 1
+                evicted.append(victim.name)
+        
+        if evicted:
+            logger.info(f"Evicted Whisper model(s) to fit the memory budget: {', '.join(evicted)}")
+            gc.collect()
+    
+    def stats(self):
+        with self._lock:
+            models = {
+                entry.name: {
+                    "loaded": entry.model is not None,
+                    "engine": entry.engine.name,
+                    "quantized": entry.quantize,
+                    "in_use": entry.in_use,
+                    "uses": entry.uses,
+                    "loads": entry.loads,
+                    "evictions": entry.evictions,
+                    "load_seconds": entry.load_seconds,
+                    "memory_mb": round(entry.memory_bytes / 1024 / 1024, 1),
+                    "last_used": entry.last_used,
+                    "batching": entry.batcher.stats() if entry.batcher else None
+                }
+                for entry in self._entries.values()
+            }
+        return {
+            "allowed": self.allowed,
+            "memory_budget_mb": round(self.memory_budget / 1024 / 1024, 1),
+            "memory_used_mb": round(sum(model["memory_mb"] for model in models.values()), 1),
+            "models": models
+        }
+
+class InferenceBatcher:
+    """
+    Collects 30-second mel windows from concurrent transcriptions and decodes
+    them in batches on a single background thread.
+    
+    A batch is dispatched as soon as max_batch_size windows with the same
+    decoding options are queued, when every active transcription is waiting
+    on a window (no more can arrive), or max_wait seconds after its oldest
+    window was queued, whichever comes first.
+    
+    Windows are decoded without a prompt: requests with different prompts
+    couldn't share a batch.
+    """
+    
+    conditions_on_previous_text = False
+    
+    def __init__(self, model, max_batch_size, max_wait):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = deque()  # (options, mel, future, queued_at)
+        self._condition = threading.Condition()
+        self._active = 0
+        self._closed = False
+        self._stats = {"batches": 0, "windows": 0, "max_batch": 0, "busy_seconds": 0.0, "wait_seconds": 0.0}
+        self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self._thread.start()
+    
+    def decode(self, mel, options):
+        """
+        Decode one (n_mels, 3000) mel window, blocking until its batch has run.
+        
+        Returns:
+            The whisper DecodingResult for this window
+        """
+        future = Future()
+        with self._condition:
+            self._queue.append((options, mel, future, time.monotonic()))
+            self._condition.notify()
+        return future.result()
+    
+    def close(self):
+        """Stop the batching thread once the queued windows have been decoded."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+    
+    def session(self):
+        """Context manager marking a transcription as active for the dispatch heuristic."""
+        return _BatcherSession(self)
+    
+    def _enter(self):
+        with self._condition:
+            self._active += 1
+    
+    def _exit(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+    
+    def _next_batch(self):
+        """Wait for a dispatchable batch and remove it from the queue."""
+        with self._condition:
+            while True:
+                if not self._queue:
+                    if self._closed:
+                        return None, None
+                    self._condition.wait()
+                    continue
+                
+                options = self._queue[0][0]
+                matching = sum(1 for item in self._queue if item[0] == options)
+                deadline = self._queue[0][3] + self.max_wait
+                remaining = deadline - time.monotonic()
+                # Every active transcription has a window queued: nothing else can join
+                everyone_waiting = len(self._queue) >= self._active
+                if matching >= self.max_batch_size or everyone_waiting or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            
+            batch = []
+            kept = deque()
+            while self._queue:
+                item = self._queue.popleft()
+                if item[0] == options and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    kept.append(item)
+            self._queue = kept
+            return options, batch
+    
+    def _run(self):
+        import torch
+        
+        while True:
+            options, batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.monotonic()
+            futures = [item[2] for item in batch]
+            try:
+                mel = torch.stack([item[1] for item in batch]).to(self.model.device)
+                with torch.no_grad():
+                    results = self.model.decode(mel, options)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.monotonic() - started
+                with self._condition:
+                    self._stats["batches"] += 1
+                    self._stats["windows"] += len(batch)
+                    self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                    self._stats["busy_seconds"] += elapsed
+                    self._stats["wait_seconds"] += sum(started - item[3] for item in batch)
+            
+            for future, result in zip(futures, results):
+                future.set_result(result)
+    
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._queue)
+            stats["active"] = self._active
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait"] = self.max_wait
+        stats["mean_batch"] = round(stats["windows"] / stats["batches"], 2) if stats["batches"] else 0
+        stats["busy_seconds"] = round(stats["busy_seconds"], 3)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        return stats
+
+class _BatcherSession:
+    def __init__(self, batcher):
+        self.batcher = batcher
+    
+    def __enter__(self):
+        self.batcher._enter()
+        return self.batcher
+    
+    def __exit__(self, *exc_info):
+        self.batcher._exit()
+
+class DirectDecoder:
+    """The batcher interface over a model, decoding every window on its own."""
+    
+    conditions_on_previous_text = True
+    
+    def __init__(self, model):
+        self.model = model
+    
+    def decode(self, mel, options):
+        import torch
+        
+        with torch.no_grad():
+            return self.model.decode(mel.unsqueeze(0).to(self.model.device), options)[0]
+    
+    def session(self):
+        return nullcontext(self)
+
+def decode_with_fallback(batcher, mel_segment, task, language, fp16, prompt=None):
+    """
+    Decode a window, retrying at higher temperatures when the output looks
+    repetitive or unlikely (the same rules as whisper.transcribe).
+    
+    Args:
+        prompt: Optional tokens of the previous text to condition on
+    """
+    from whisper.decoding import DecodingOptions
+    
+    result = None
+    for temperature in TEMPERATURES:
+        options = DecodingOptions(task=task, language=language, temperature=temperature, prompt=prompt, fp16=fp16)
+        result = batcher.decode(mel_segment, options)
+        
+        needs_fallback = (
+            result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+            or result.avg_logprob < LOGPROB_THRESHOLD
+        )
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            needs_fallback = False  # silence
+        if not needs_fallback:
+            break
+    return result
+
+def transcribe(batcher, audio, task="transcribe", language=None, fp16=False, segment_callback=None):
+    """
+    Transcribe audio through the batcher (or a DirectDecoder).
+    
+    Mirrors whisper.transcribe's window loop with its default options. Each
+    window is conditioned on the text decoded so far, as whisper.transcribe
+    does, if the batcher supports it (DirectDecoder does, InferenceBatcher
+    doesn't), so a DirectDecoder gives the same result as model.transcribe.
+    
+    Args:
+        segment_callback: Optional callable(segments, progress) called with
+            the new segments after each window is decoded
+    
+    Returns:
+        A dict with "text", "segments" and "language", like model.transcribe
+    """
+    import torch
+    import whisper
+    from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE
+    from whisper.tokenizer import get_tokenizer
+    
+    model = batcher.model
+    mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+    if language is None and not model.is_multilingual:
+        language = "en"
+    
+    input_stride = N_FRAMES // model.dims.n_audio_ctx  # mel frames per output token
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE  # seconds per output token
+    tokenizer = None
+    all_tokens = []
+    all_segments = []
+    prompt_reset_since = 0
+    seek = 0
+    
+    with batcher.session():
+        while seek < content_frames:
+            time_offset = float(seek * HOP_LENGTH / SAMPLE_RATE)
+            segment_size = min(N_FRAMES, content_frames - seek)
+            segment_duration = segment_size * HOP_LENGTH / SAMPLE_RATE
+            mel_segment = whisper.pad_or_trim(mel[:, seek:seek + segment_size], N_FRAMES)
+            
+            # The first window of a request without a language detects it
+            prompt = all_tokens[prompt_reset_since:] if batcher.conditions_on_previous_text else None
+            result = decode_with_fallback(batcher, mel_segment, task, language, fp16, prompt)
+            if tokenizer is None:
+                language = language or result.language
+                tokenizer = get_tokenizer(
+                    model.is_multilingual,
+                    num_languages=model.num_languages,
+                    language=language,
+                    task=task
+                )
+            
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob <= LOGPROB_THRESHOLD:
+                seek += segment_size
+                if segment_callback:
+                    segment_callback([], min(seek / content_frames, 1.0))
+                continue
+            
+            tokens = torch.tensor(result.tokens)
+            current_segments = []
+            
+            def new_segment(start, end, segment_tokens):
+                segment_tokens = segment_tokens.tolist()
+                return {
+                    "seek": seek,
+                    "start": start,
+                    "end": end,
+                    "text": tokenizer.decode([token for token in segment_tokens if token < tokenizer.eot]),
+                    "tokens": segment_tokens,
+                    "temperature": result.temperature,
+                    "avg_logprob": result.avg_logprob,
+                    "compression_ratio": result.compression_ratio,
+                    "no_speech_prob": result.no_speech_prob
+                }
+            
+            timestamp_tokens = tokens.ge(tokenizer.timestamp_begin)
+            single_timestamp_ending = timestamp_tokens[-2:].tolist() == [False, True]
+            consecutive = torch.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0] + 1
+            
+            if len(consecutive) > 0:
+                # Segments are delimited by pairs of consecutive timestamp tokens
+                slices = consecutive.tolist()
+                if single_timestamp_ending:
+                    slices.append(len(tokens))
+                
+                last_slice = 0
+                for current_slice in slices:
+                    sliced_tokens = tokens[last_slice:current_slice]
+                    start_position = sliced_tokens[0].item() - tokenizer.timestamp_begin
+                    end_position = sliced_tokens[-1].item() - tokenizer.timestamp_begin
+                    current_segments.append(new_segment(
+                        time_offset + start_position * time_precision,
+                        time_offset + end_position * time_precision,
+                        sliced_tokens
+                    ))
+                    last_slice = current_slice
+                
+                if single_timestamp_ending:
+                    seek += segment_size
+                else:
+                    # Resume at the last complete segment
+                    last_position = tokens[last_slice - 1].item() - tokenizer.timestamp_begin
+                    seek += last_position * input_stride
+            else:
+                duration = segment_duration
+                timestamps = tokens[timestamp_tokens.nonzero().flatten()]
+                if len(timestamps) > 0 and timestamps[-1].item() != tokenizer.timestamp_begin:
+                    duration = (timestamps[-1].item() - tokenizer.timestamp_begin) * time_precision
+                current_segments.append(new_segment(time_offset, time_offset + duration, tokens))
+                seek += segment_size
+            
+            for segment in current_segments:
+                if segment["start"] == segment["end"] or segment["text"].strip() == "":
+                    segment["text"] = ""
+                    segment["tokens"] = []
+            
+            new_segments = []
+            for segment in current_segments:
+                new_segments.append({"id": len(all_segments), **segment})
+                all_segments.append(new_segments[-1])
+                all_tokens.extend(segment["tokens"])
+            # A high-temperature window is too unreliable to prompt the next one
+            if result.temperature > 0.5:
+                prompt_reset_since = len(all_tokens)
+            if segment_callback:
+                segment_callback(new_segments, min(seek / content_frames, 1.0))
+    
+    return {
+        "text": tokenizer.decode(all_tokens) if tokenizer else "",
+        "segments": all_segments,
+        "language": language
+    }
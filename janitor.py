@@ -0,0 +1,314 @@
+"""
+Disk housekeeping for TEMP_DIR.
+
+Requests that download to disk work in their own TEMP_DIR/<uuid> directory,
+created with create_work_dir() and removed with remove_work_dir(). While it
+exists the directory holds an advisory lock (flock on its .lock file), which
+the kernel releases when the process dies. A directory whose lock nobody
+holds was therefore left behind by a request that crashed or was killed,
+in whichever gunicorn worker, and can be reaped.
+
+TempDirJanitor sweeps TEMP_DIR on a background thread: it reaps orphaned
+work directories once they are old enough, then keeps TEMP_DIR under a size
+budget and the filesystem above a free-space floor, first by reaping every
+orphan and then by evicting cache entries (see storage.py).
+"""
+
+import os
+import time
+import uuid
+import fcntl
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = ".lock"
+
+# A work directory is created a moment before its lock; never reap one
+# younger than this, even under disk pressure
+MIN_ORPHAN_AGE = 30
+
+# Lock files of the work directories created by this process, by path
+_held_locks = {}
+_held_locks_lock = threading.Lock()
+
+def create_work_dir(root):
+    """
+    Create a uniquely named work directory under root and lock it.
+    
+    Returns:
+        The path of the new directory
+    """
+    path = os.path.join(root, str(uuid.uuid4()))
+    os.makedirs(path)
+    lock_file = open(os.path.join(path, LOCK_NAME), "w")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    with _held_locks_lock:
+        _held_locks[path] = lock_file
+    return path
+
+def remove_work_dir(path):
+    """Remove a work directory made by create_work_dir() and release its lock."""
+    shutil.rmtree(path, ignore_errors=True)
+    with _held_locks_lock:
+        lock_file = _held_locks.pop(path, None)
+    if lock_file:
+        lock_file.close()
+
+def is_work_dir_name(name):
+    try:
+        uuid.UUID(name)
+        return True
+    except ValueError:
+        return False
+
+def tree_size(path):
+    """Bytes of the regular files under path (0 if it is gone)."""
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                continue
+    return total
+
+def tree_mtime(path):
+    """
+    Latest modification time of what is under path, or of path itself when
+    it is empty. The lock file is left out, since claiming a directory
+    creates it.
+    """
+    latest = None
+    for directory, dirs, files in os.walk(path):
+        for name in dirs + files:
+            if directory == path and name == LOCK_NAME:
+                continue
+            try:
+                mtime = os.lstat(os.path.join(directory, name)).st_mtime
+            except OSError:
+                continue
+            latest = mtime if latest is None else max(latest, mtime)
+    return latest if latest is not None else os.stat(path).st_mtime
+
+class TempDirJanitor:
+    """
+    Background thread that keeps TEMP_DIR from filling its volume.
+    
+    Every interval seconds, one process at a time (sweeps are serialized
+    across gunicorn workers by a lock file in temp_dir):
+    
+    - Work directories nobody holds a lock on and untouched for orphan_age
+      seconds are removed, as are stray temporary files (".<name>.tmp", from
+      an interrupted atomic write) in the caches.
+    - While temp_dir holds more than max_bytes, or its filesystem has less
+      than min_free_bytes free, the remaining orphans are removed, oldest
+      first, and then entries are evicted from caches (storage.Storage
+      instances) by their own policy. Work directories and cache entries in
+      use are never touched.
+    
+    A limit of 0 disables it.
+    """
+    
+    def __init__(self, temp_dir, caches=(), max_bytes=0, min_free_bytes=0, orphan_age=900, interval=60):
+        self.temp_dir = temp_dir
+        self.caches = list(caches)
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.orphan_age = orphan_age
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._usage = {}
+        self._stats = {
+            "sweeps": 0, "skipped_sweeps": 0, "errors": 0,
+            "orphans_removed": 0, "orphan_bytes_removed": 0,
+            "cache_bytes_evicted": 0,
+            "last_sweep_at": None, "last_sweep_seconds": None
+        }
+    
+    def start(self):
+        """Start the sweeping thread in this process (again after a fork)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="temp-janitor", daemon=True)
+            self._thread.start()
+    
+    def wake(self):
+        """Run a sweep now rather than at the end of the interval."""
+        self._wakeup.set()
+    
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                logger.error(f"TEMP_DIR sweep failed: {str(e)}", exc_info=True)
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+    
+    def sweep(self):
+        """
+        Reap orphans and enforce the disk limits once.
+        
+        Returns:
+            False if another process was sweeping, True otherwise
+        """
+        with open(os.path.join(self.temp_dir, ".janitor.lock"), "a") as sweep_lock:
+            try:
+                fcntl.flock(sweep_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                with self._lock:
+                    self._stats["skipped_sweeps"] += 1
+                return False
+            
+            started = time.monotonic()
+            now = time.time()
+            orphans = []
+            active = 0
+            for name in os.listdir(self.temp_dir):
+                path = os.path.join(self.temp_dir, name)
+                if not is_work_dir_name(name) or not os.path.isdir(path):
+                    continue
+                orphan = self._claim_orphan(path)
+                if orphan is None:
+                    active += 1
+                    continue
+                try:
+                    orphans.append((tree_mtime(path), path, orphan))
+                except OSError:
+                    orphan.close()  # Removed by its owner meanwhile
+            orphans.sort(key=lambda entry: entry[0])
+            
+            try:
+                for _, path, _ in [entry for entry in orphans if entry[0] < now - self.orphan_age]:
+                    self._remove_orphan(path)
+                self._remove_stray_temp_files(now)
+                
+                used = tree_size(self.temp_dir)
+                for modified, path, _ in orphans:
+                    if not self._over_limits(used):
+                        break
+                    if modified < now - MIN_ORPHAN_AGE and os.path.exists(path):
+                        used -= self._remove_orphan(path)
+                if self._over_limits(used):
+                    used -= self._evict_cache(used)
+            finally:
+                for _, _, orphan in orphans:
+                    orphan.close()
+            
+            disk = shutil.disk_usage(self.temp_dir)
+            with self._lock:
+                self._usage = {"used_bytes": used, "work_dirs": active}
+                if self.min_free_bytes and disk.free < self.min_free_bytes:
+                    logger.warning(f"TEMP_DIR free space ({disk.free} bytes) is below the floor of {self.min_free_bytes} bytes")
+                self._stats["sweeps"] += 1
+                self._stats["last_sweep_at"] = now
+                self._stats["last_sweep_seconds"] = round(time.monotonic() - started, 3)
+            return True
+    
+    def _claim_orphan(self, path):
+        """
+        Take the lock of a work directory nobody is using.
+        
+        Directories created before work directories had locks get a lock
+        file now and are claimed like any other.
+        
+        Returns:
+            The open lock file (hold it while removing the directory), or
+            None if the directory is in use or gone
+        """
+        try:
+            lock_file = open(os.path.join(path, LOCK_NAME), "a")
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+    
+    def _remove_orphan(self, path):
+        size = tree_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self._stats["orphans_removed"] += 1
+            self._stats["orphan_bytes_removed"] += size
+        logger.info(f"Removed orphaned work directory {path} ({size} bytes)")
+        return size
+    
+    def _remove_stray_temp_files(self, now):
+        for cache in self.caches:
+            try:
+                entries = list(os.scandir(cache.directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if not (entry.name.startswith(".") and entry.name.endswith(".tmp")):
+                    continue
+                try:
+                    if entry.stat().st_mtime < now - self.orphan_age:
+                        os.remove(entry.path)
+                except OSError:
+                    continue
+    
+    def _over_budget(self, used):
+        return bool(self.max_bytes) and used > self.max_bytes
+    
+    def _low_on_space(self):
+        return bool(self.min_free_bytes) and shutil.disk_usage(self.temp_dir).free < self.min_free_bytes
+    
+    def _over_limits(self, used):
+        return self._over_budget(used) or self._low_on_space()
+    
+    def _evict_cache(self, used):
+        """Evict cache entries until within the limits; returns the bytes freed under temp_dir."""
+        temp_dir = os.path.abspath(self.temp_dir) + os.sep
+        freed = 0
+        for cache in self.caches:
+            inside = os.path.abspath(cache.directory).startswith(temp_dir)
+            deficit = 0
+            if self._low_on_space():
+                deficit = self.min_free_bytes - shutil.disk_usage(self.temp_dir).free
+            # Caches outside temp_dir only count against the free-space floor
+            if inside and self._over_budget(used - freed):
+                deficit = max(deficit, used - freed - self.max_bytes)
+            if deficit <= 0:
+                continue
+            evicted = cache.evict(deficit)
+            if inside:
+                freed += evicted
+            with self._lock:
+                self._stats["cache_bytes_evicted"] += evicted
+            if evicted:
+                logger.info(f"Evicted {evicted} bytes from {cache.directory} to free disk space")
+        return freed
+    
+    def stats(self):
+        """Disk usage of TEMP_DIR and this process's sweep counters."""
+        try:
+            disk = shutil.disk_usage(self.temp_dir)
+            filesystem = {"total_bytes": disk.total, "free_bytes": disk.free}
+        except OSError:
+            filesystem = {}
+        with self._lock:
+            return dict(
+                self._stats,
+                **self._usage,
+                **filesystem,
+                temp_dir=self.temp_dir,
+                max_bytes=self.max_bytes,
+                min_free_bytes=self.min_free_bytes,
+                orphan_age=self.orphan_age,
+                interval=self.interval,
+                running=bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+            )
@@ -27,50 +27,94 @@ document.addEventListener('DOMContentLoaded', function() {
         const url = document.getElementById('transcribeUrl').value;
         const resultDiv = document.getElementById('transcribeResult');
         const loadingDiv = document.getElementById('transcribeLoading');
+        const statusText = document.getElementById('transcribeStatus');
         
         resultDiv.style.display = 'none';
+        resultDiv.innerHTML = '';
         loadingDiv.style.display = 'block';
+        statusText.textContent = 'Starting...';
+        
+        const stageNames = {
+            queued: 'Waiting in queue',
+            downloading: 'Downloading audio',
+            decoding: 'Decoding audio',
+            transcribing: 'Transcribing'
+        };
+        let transcriptionText = null;
+        let segmentsList = null;
+        
+        function showError(message) {
+            loadingDiv.style.display = 'none';
+            resultDiv.style.display = 'block';
+            resultDiv.textContent = 'Error: ' + message;
+        }
+        
+        function showResultArea() {
+            if (transcriptionText) {
+                return;
+            }
+            resultDiv.style.display = 'block';
+            resultDiv.innerHTML = '<h3>Transcription:</h3><p></p><h3>Segments:</h3><ul></ul>';
+            transcriptionText = resultDiv.querySelector('p');
+            segmentsList = resultDiv.querySelector('ul');
+        }
+        
+        // Segments arrive as soon as each 30-second window is transcribed
+        function handleEvent(event) {
+            if (event.event === 'progress') {
+                const stage = stageNames[event.stage] || event.stage;
+                statusText.textContent = `${stage}... ${Math.round(event.progress * 100)}%`;
+            } else if (event.event === 'segment') {
+                showResultArea();
+                transcriptionText.textContent += event.text;
+                const item = document.createElement('li');
+                item.textContent = `${event.start.toFixed(2)}s - ${event.end.toFixed(2)}s: ${event.text}`;
+                segmentsList.appendChild(item);
+            } else if (event.event === 'done') {
+                showResultArea();
+                transcriptionText.textContent = event.transcription;
+                loadingDiv.style.display = 'none';
+            } else if (event.event === 'error') {
+                showError(event.error);
+            }
+        }
         
         fetch('/transcribe', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'application/x-ndjson',
             },
-            body: JSON.stringify({ url: url }),
+            body: JSON.stringify({ url: url, stream: 'ndjson' }),
         })
-        .then(response => {
+        .then(async response => {
             if (!response.ok) {
-                throw new Error('Network response was not ok');
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.error || 'Network response was not ok');
             }
-            return response.json();
-        })
-        .then(data => {
-            loadingDiv.style.display = 'none';
-            resultDiv.style.display = 'block';
             
-            if (data.error) {
-                resultDiv.textContent = 'Error: ' + data.error;
-            } else {
-                resultDiv.innerHTML = '<h3>Transcription:</h3><p>' + data.transcription + '</p>';
-                
-                if (data.segments && data.segments.length > 0) {
-                    let segmentsHtml = '<h3>Segments:</h3><ul>';
-                    for (let i = 0; i < Math.min(10, data.segments.length); i++) {
-                        const segment = data.segments[i];
-                        segmentsHtml += `<li>${segment.start.toFixed(2)}s - ${segment.end.toFixed(2)}s: ${segment.text}</li>`;
-                    }
-                    if (data.segments.length > 10) {
-                        segmentsHtml += '<li>...</li>';
+            // One JSON event per line
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) {
+                        handleEvent(JSON.parse(line));
                     }
-                    segmentsHtml += '</ul>';
-                    resultDiv.innerHTML += segmentsHtml;
                 }
             }
+            loadingDiv.style.display = 'none';
         })
         .catch(error => {
-            loadingDiv.style.display = 'none';
-            resultDiv.style.display = 'block';
-            resultDiv.textContent = 'Error: ' + error.message;
+            showError(error.message);
         });
     });
     
@@ -80,33 +124,21 @@ document.addEventListener('DOMContentLoaded', function() {
         
         const url = document.getElementById('downloadUrl').value;
         const resultDiv = document.getElementById('downloadResult');
-        const loadingDiv = document.getElementById('downloadLoading');
-        
-        resultDiv.style.display = 'none';
-        loadingDiv.style.display = 'block';
         
-        // Create a download link
+        // The server streams the MP3 as it is encoded, so the browser's own
+        // download starts within a second or so; no need to wait for it here
         const downloadUrl = `/downloads?url=${encodeURIComponent(url)}`;
+        const link = document.createElement('a');
+        link.href = downloadUrl;
+        link.download = '';
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
         
-        // Create an iframe to trigger the download
-        const iframe = document.createElement('iframe');
-        iframe.style.display = 'none';
-        iframe.src = downloadUrl;
-        document.body.appendChild(iframe);
-        
-        // Show a message
-        setTimeout(() => {
-            loadingDiv.style.display = 'none';
-            resultDiv.style.display = 'block';
-            resultDiv.innerHTML = `
-                <p>Your download should start automatically.</p>
-                <p>If it doesn't, <a href="${downloadUrl}" target="_blank">click here</a> to download directly.</p>
-            `;
-            
-            // Remove the iframe after a while
-            setTimeout(() => {
-                document.body.removeChild(iframe);
-            }, 5000);
-        }, 2000);
+        resultDiv.style.display = 'block';
+        resultDiv.innerHTML = `
+            <p>Your download has started.</p>
+            <p>If it doesn't, <a href="${downloadUrl}" target="_blank">click here</a> to download directly.</p>
+        `;
     });
 });
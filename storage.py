@@ -0,0 +1,552 @@
+"""
+Size-budgeted file storage for the on-disk caches.
+
+A Storage keeps files in one directory under a byte and/or entry budget,
+evicting the least recently (LRU) or least frequently (LFU) used entries
+when a new file would exceed it. Entries that are in use are never evicted:
+readers take a Pin, which counts the reference in this process and holds a
+shared flock on the file, so the other gunicorn workers see it too.
+
+The index lives in memory as parallel arrays (size, last use, use count and
+pin count per slot) plus a name -> slot dict: under 200 bytes per entry. It
+is shared between processes through an append-only journal in the storage
+directory (.index.log): every put, access and removal appends a checksummed
+record, and each process replays the records appended by the others before
+using its index. When the journal has grown well past the live entries it
+is compacted into one record per entry and atomically renamed into place.
+
+On startup the journal is replayed up to its last intact record (a torn
+write after a crash is dropped) and reconciled with the files actually in
+the directory, so a lost journal or a crash between a rename and its record
+costs nothing but the use statistics.
+"""
+
+import os
+import time
+import uuid
+import zlib
+import fcntl
+import heapq
+import shutil
+import struct
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = ".index.log"
+JOURNAL_LOCK_NAME = ".index.lock"
+
+# Record header: operation, use count, timestamp, size and name length,
+# followed by the UTF-8 name and a CRC32 of the header and name
+RECORD = struct.Struct("<cIdqH")
+CHECKSUM = struct.Struct("<I")
+PUT, ACCESS, DELETE = b"P", b"A", b"D"
+OPERATIONS = (PUT, ACCESS, DELETE)
+
+# Compact the journal once it is this many times its size after the last
+# compaction (and at least COMPACT_MIN_BYTES)
+COMPACT_GROWTH = 4
+COMPACT_MIN_BYTES = 1024 * 1024
+
+# Over budget, evict down to this fraction of it, so a full cache doesn't
+# evict on every put
+LOW_WATER_MARK = 0.9
+
+POLICIES = ("lru", "lfu")
+
+def encode_record(operation, name, size=0, timestamp=0.0, hits=0):
+    encoded_name = name.encode("utf-8")
+    data = RECORD.pack(operation, min(hits, 0xFFFFFFFF), timestamp, size, len(encoded_name)) + encoded_name
+    return data + CHECKSUM.pack(zlib.crc32(data))
+
+def decode_records(data):
+    """
+    Decode journal records up to the first incomplete or corrupt one.
+    
+    Returns:
+        A list of (operation, name, size, timestamp, hits) tuples and the
+        number of bytes they span
+    """
+    records = []
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        operation, hits, timestamp, size, name_length = RECORD.unpack_from(data, offset)
+        end = offset + RECORD.size + name_length
+        if end + CHECKSUM.size > len(data):
+            break
+        (checksum,) = CHECKSUM.unpack_from(data, end)
+        if operation not in OPERATIONS or zlib.crc32(data[offset:end]) != checksum:
+            break
+        try:
+            name = data[offset + RECORD.size:end].decode("utf-8")
+        except UnicodeDecodeError:
+            break
+        records.append((operation, name, size, timestamp, hits))
+        offset = end + CHECKSUM.size
+    return records, offset
+
+class Pin:
+    """
+    A reference to a stored file: it is not evicted until released.
+    
+    Usable as a context manager.
+    """
+    
+    def __init__(self, storage, name, path, file):
+        self.storage = storage
+        self.name = name
+        self.path = path
+        self._file = file
+    
+    def release(self):
+        if self._file is None:
+            return
+        self.storage._unpin(self.name)
+        self._file.close()
+        self._file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+
+class Storage:
+    """
+    A directory of files under a byte and entry budget.
+    
+    Names are plain file names; names starting with "." are reserved for
+    temporary and lock files and are never indexed.
+    
+    Args:
+        directory: Where the files are stored (created if missing)
+        max_bytes: Byte budget, or 0 for none
+        max_entries: Entry budget, or 0 for none
+        policy: "lru" to evict the least recently used entries first, "lfu"
+            the least frequently used (then least recently used)
+    """
+    
+    def __init__(self, directory, max_bytes=0, max_entries=0, policy="lru"):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of: {', '.join(POLICIES)}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        self._journal_path = os.path.join(directory, JOURNAL_NAME)
+        self._journal_lock_path = os.path.join(directory, JOURNAL_LOCK_NAME)
+        self._lock = threading.RLock()
+        self._stats = {"evictions": 0, "evicted_bytes": 0, "compactions": 0, "recovered": 0, "dropped": 0}
+        self._reset()
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            with self._journal_lock(fcntl.LOCK_EX):
+                self._recover()
+            self._enforce_budget()
+    
+    def _reset(self):
+        self._slots = {}
+        self._names = []
+        self._sizes = array("q")
+        self._last_used = array("d")
+        self._hits = array("I")
+        self._pins = array("I")
+        self._free_slots = []
+        self._bytes = 0
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._compacted_size = 0
+    
+    def path(self, name):
+        """Path of the file stored under name (which may not exist)."""
+        return os.path.join(self.directory, name)
+    
+    def __contains__(self, name):
+        with self._lock:
+            self._sync()
+            return name in self._slots
+    
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._slots)
+    
+    def names(self):
+        """Names of the stored entries."""
+        with self._lock:
+            self._sync()
+            return list(self._slots)
+    
+    def put(self, name, source_path):
+        """
+        Move a file into the storage under name, replacing any entry with
+        the same name, and evict other entries if over budget.
+        
+        The file is moved to a temporary name in the directory first and then
+        renamed into place, so readers never see a partial file.
+        
+        Returns:
+            The path of the stored file
+        """
+        final_path = self.path(name)
+        tmp_path = os.path.join(self.directory, f".{name}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.move(source_path, tmp_path)
+            os.replace(tmp_path, final_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._added(name, final_path)
+        return final_path
+    
+    def write(self, name, data):
+        """Atomically store data (bytes) under name; see put()."""
+        final_path = self.path(name)
+        tmp_path = os.path.join(self.directory, f".{name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, final_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._added(name, final_path)
+        return final_path
+    
+    def _added(self, name, path):
+        size = os.stat(path).st_size
+        with self._lock:
+            self._append(encode_record(PUT, name, size, time.time()))
+            self._enforce_budget(keep=name)
+    
+    def pin(self, name):
+        """
+        Take a reference to a stored file and record the access.
+        
+        Returns:
+            A Pin (release it when done with the file), or None if there is
+            no such entry
+        """
+        path = self.path(name)
+        with self._lock:
+            self._sync()
+            known = name in self._slots
+        
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            if known:
+                self._forget(name)
+            return None
+        # Waits while an evicting process holds the file exclusively, then
+        # checks that it didn't remove it meanwhile
+        fcntl.flock(file, fcntl.LOCK_SH)
+        if os.fstat(file.fileno()).st_nlink == 0:
+            file.close()
+            return None
+        
+        with self._lock:
+            if not known:
+                # Stored before the index knew about it (e.g. by an older version)
+                self._append(encode_record(PUT, name, os.fstat(file.fileno()).st_size, time.time()))
+            self._append(encode_record(ACCESS, name, timestamp=time.time()))
+            slot = self._slots.get(name)
+            if slot is not None:
+                self._pins[slot] += 1
+        return Pin(self, name, path, file)
+    
+    def _unpin(self, name):
+        with self._lock:
+            slot = self._slots.get(name)
+            if slot is not None and self._pins[slot] > 0:
+                self._pins[slot] -= 1
+    
+    def touch(self, name):
+        """Record an access to an entry; returns whether it exists."""
+        with self._lock:
+            self._sync()
+            if name not in self._slots:
+                return False
+            self._append(encode_record(ACCESS, name, timestamp=time.time()))
+            return True
+    
+    def remove(self, name):
+        """Remove an entry, even if pinned (readers keep their open file); returns whether it existed."""
+        try:
+            os.remove(self.path(name))
+            removed = True
+        except FileNotFoundError:
+            removed = False
+        with self._lock:
+            self._sync()
+            if name in self._slots:
+                self._append(encode_record(DELETE, name))
+        return removed
+    
+    def _forget(self, name):
+        with self._lock:
+            self._append(encode_record(DELETE, name))
+            self._stats["dropped"] += 1
+    
+    def evict(self, nbytes=0, entries=0, keep=None):
+        """
+        Evict unpinned entries in policy order until nbytes bytes and at
+        least entries entries have been freed, or nothing evictable is left.
+        
+        Returns:
+            The number of bytes freed
+        """
+        freed_bytes = 0
+        freed_entries = 0
+        with self._lock:
+            self._sync()
+            skipped = set()
+            while freed_bytes < nbytes or freed_entries < entries:
+                # Choosing candidates scans the whole index: take enough for
+                # the whole request at once, from the average entry size
+                average_size = self._bytes / max(len(self._slots), 1)
+                count = max(64, entries - freed_entries, int((nbytes - freed_bytes) / max(average_size, 1) * 1.25))
+                batch = self._eviction_candidates(count, skipped, keep)
+                if not batch:
+                    break
+                for slot in batch:
+                    if freed_bytes >= nbytes and freed_entries >= entries:
+                        break
+                    # Records replayed since the batch was chosen may have
+                    # freed or reused the slot
+                    name = self._names[slot]
+                    if name is None or name == keep or self._pins[slot]:
+                        continue
+                    size = self._sizes[slot]
+                    if not self._remove_unpinned(name):
+                        skipped.add(slot)
+                        continue
+                    self._append(encode_record(DELETE, name))
+                    freed_bytes += size
+                    freed_entries += 1
+                    self._stats["evictions"] += 1
+                    self._stats["evicted_bytes"] += size
+                    logger.info(f"Evicted {self.path(name)} ({size} bytes)")
+        return freed_bytes
+    
+    def _eviction_candidates(self, count, skipped, keep):
+        """The count unpinned slots to evict first, by policy."""
+        slots = (
+            slot for slot in self._slots.values()
+            if not self._pins[slot] and slot not in skipped and self._names[slot] != keep
+        )
+        if self.policy == "lfu":
+            return heapq.nsmallest(count, slots, key=lambda slot: (self._hits[slot], self._last_used[slot]))
+        return heapq.nsmallest(count, slots, key=self._last_used.__getitem__)
+    
+    def _remove_unpinned(self, name):
+        """Remove a file unless another process has it pinned; returns whether it is gone."""
+        try:
+            file = open(self.path(name), "rb")
+        except FileNotFoundError:
+            return True
+        with file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            return True
+    
+    def _enforce_budget(self, keep=None):
+        nbytes = 0
+        entries = 0
+        if self.max_bytes and self._bytes > self.max_bytes:
+            nbytes = self._bytes - int(self.max_bytes * LOW_WATER_MARK)
+        if self.max_entries and len(self._slots) > self.max_entries:
+            entries = len(self._slots) - int(self.max_entries * LOW_WATER_MARK)
+        if nbytes or entries:
+            self.evict(nbytes, entries, keep)
+    
+    @contextmanager
+    def _journal_lock(self, operation):
+        """Shared for appends, exclusive for rewriting the journal."""
+        with open(self._journal_lock_path, "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _append(self, record):
+        """Append a record to the journal and apply it (with any appended by other processes)."""
+        with self._journal_lock(fcntl.LOCK_SH):
+            fd = os.open(self._journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, record)
+            finally:
+                os.close(fd)
+        self._sync()
+        if os.path.getsize(self._journal_path) > max(COMPACT_MIN_BYTES, COMPACT_GROWTH * self._compacted_size):
+            self.compact()
+    
+    def _sync(self):
+        """Apply the records appended since the last sync; reload after another process compacted."""
+        try:
+            f = open(self._journal_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            reloaded = stat.st_ino != self._journal_inode
+            if reloaded:
+                # A new journal (compacted by another process): rebuild the
+                # index from it, keeping the pins of this process
+                pins = {name: self._pins[slot] for name, slot in self._slots.items() if self._pins[slot]}
+                self._reset()
+                self._journal_inode = stat.st_ino
+                self._compacted_size = stat.st_size
+            else:
+                f.seek(self._journal_offset)
+            data = f.read()
+        
+        records, consumed = decode_records(data)
+        self._apply(records)
+        self._journal_offset += consumed
+        if reloaded:
+            for name, count in pins.items():
+                slot = self._slots.get(name)
+                if slot is not None:
+                    self._pins[slot] = count
+    
+    def _apply(self, records):
+        for operation, name, size, timestamp, hits in records:
+            slot = self._slots.get(name)
+            if operation == PUT:
+                if slot is None:
+                    slot = self._allocate(name)
+                else:
+                    self._bytes -= self._sizes[slot]
+                self._sizes[slot] = size
+                self._last_used[slot] = timestamp
+                self._hits[slot] = hits
+                self._bytes += size
+            elif slot is None:
+                continue
+            elif operation == ACCESS:
+                self._last_used[slot] = max(self._last_used[slot], timestamp)
+                self._hits[slot] = min(self._hits[slot] + 1, 0xFFFFFFFF)
+            else:
+                self._bytes -= self._sizes[slot]
+                del self._slots[name]
+                self._names[slot] = None
+                self._free_slots.append(slot)
+    
+    def _allocate(self, name):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._names[slot] = name
+            self._pins[slot] = 0
+        else:
+            slot = len(self._names)
+            self._names.append(name)
+            self._sizes.append(0)
+            self._last_used.append(0.0)
+            self._hits.append(0)
+            self._pins.append(0)
+        self._slots[name] = slot
+        return slot
+    
+    def _recover(self):
+        """
+        Rebuild the index from the journal and the directory, then compact.
+        
+        Called with the journal locked exclusively.
+        """
+        self._reset()
+        self._sync()
+        
+        present = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        present[entry.name] = entry.stat()
+                except OSError:
+                    continue
+        
+        records = []
+        for name, slot in list(self._slots.items()):
+            stat = present.get(name)
+            if stat is None:
+                records.append((DELETE, name, 0, 0.0, 0))
+                self._stats["dropped"] += 1
+            elif stat.st_size != self._sizes[slot]:
+                records.append((PUT, name, stat.st_size, self._last_used[slot], self._hits[slot]))
+        for name, stat in present.items():
+            if name not in self._slots:
+                records.append((PUT, name, stat.st_size, max(stat.st_atime, stat.st_mtime), 0))
+                self._stats["recovered"] += 1
+        self._apply(records)
+        self._rewrite_journal()
+        if self._stats["recovered"] or self._stats["dropped"]:
+            logger.info(
+                f"Recovered index of {self.directory}: {len(self._slots)} entries, "
+                f"{self._stats['recovered']} found on disk, {self._stats['dropped']} missing"
+            )
+    
+    def compact(self):
+        """Rewrite the journal as one record per live entry."""
+        with self._lock, self._journal_lock(fcntl.LOCK_EX):
+            self._sync()
+            self._rewrite_journal()
+            self._stats["compactions"] += 1
+    
+    def _rewrite_journal(self):
+        tmp_path = f"{self._journal_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for name, slot in self._slots.items():
+                    f.write(encode_record(PUT, name, self._sizes[slot], self._last_used[slot], self._hits[slot]))
+                f.flush()
+                os.fsync(f.fileno())
+                stat = os.fstat(f.fileno())
+            os.replace(tmp_path, self._journal_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        # Make the rename itself durable
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+        self._journal_inode = stat.st_ino
+        self._journal_offset = stat.st_size
+        self._compacted_size = stat.st_size
+    
+    def stats(self):
+        """Size of the index and the budget, eviction and recovery counters."""
+        with self._lock:
+            self._sync()
+            try:
+                journal_bytes = os.path.getsize(self._journal_path)
+            except OSError:
+                journal_bytes = 0
+            return dict(
+                self._stats,
+                entries=len(self._slots),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                max_entries=self.max_entries,
+                policy=self.policy,
+                pinned=sum(1 for slot in self._slots.values() if self._pins[slot]),
+                journal_bytes=journal_bytes
+            )
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Regression check for resolve_audio_stream on the unprocessed video info that
+get_video_info caches (extract_info with process=False).
+
+The YouTube extractor leaves the protocol and HTTP headers of its formats to
+yt-dlp's format processing, so a stream picked from the raw formats has
+neither. When no stream is found, streamed /downloads and /transcribe quietly
+fall back to a full download, so the failure only shows up as latency.
+
+Runs offline against test_fixtures/youtube_info_unprocessed.json, the
+unprocessed info of a YouTube video.
+
+Usage:
+    python test_audio_stream.py
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+TEMP_DIR = tempfile.mkdtemp(prefix="youtube-api-test-")
+os.environ["TEMP_DIR"] = TEMP_DIR
+
+import app  # noqa: E402  (configured from the environment on import)
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_fixtures", "youtube_info_unprocessed.json")
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+class ResolveAudioStreamTest(unittest.TestCase):
+    
+    def setUp(self):
+        with open(FIXTURE, encoding="utf-8") as f:
+            self.info = json.load(f)
+        with app.video_info_lock:
+            app.video_info_cache[app.video_info_cache_key(URL)] = (time.monotonic() + 3600, self.info)
+    
+    def tearDown(self):
+        with app.video_info_lock:
+            app.video_info_cache.clear()
+    
+    def assertStream(self, stream_url, headers, itag):
+        self.assertIn(f"itag={itag}&", stream_url)
+        self.assertIn("User-Agent", headers)
+    
+    def test_fixture_is_unprocessed(self):
+        https_formats = [f for f in self.info["formats"] if f["url"].startswith("https://rr")]
+        self.assertTrue(https_formats)
+        self.assertFalse(any("protocol" in f or "http_headers" in f for f in https_formats))
+    
+    def test_best_quality(self):
+        # The highest-bitrate audio-only stream, for MP3 downloads
+        stream_url, headers, duration = app.resolve_audio_stream(URL, best_quality=True)
+        self.assertStream(stream_url, headers, 251)
+        self.assertEqual(duration, 212)
+    
+    def test_transcription_format(self):
+        stream_url, headers, duration = app.resolve_audio_stream(URL)
+        self.assertIn("googlevideo.com/videoplayback", stream_url)
+        self.assertIn("User-Agent", headers)
+        self.assertEqual(duration, 212)
+    
+    def test_cached_info_unchanged(self):
+        app.resolve_audio_stream(URL, best_quality=True)
+        with open(FIXTURE, encoding="utf-8") as f:
+            self.assertEqual(self.info, json.load(f))
+
+if __name__ == "__main__":
+    try:
+        unittest.main()
+    finally:
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
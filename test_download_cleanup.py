@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Regression check for /downloads: every response must release what it holds
+once its body is closed (the cache pin of a cached MP3, the work directory
+and its lock of a fresh download), or cache entries can never be evicted
+and TEMP_DIR fills up.
+
+Runs the app in-process with Flask's test client and a throwaway TEMP_DIR;
+no network access or Whisper model is needed.
+
+Usage:
+    python test_download_cleanup.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+TEMP_DIR = tempfile.mkdtemp(prefix="youtube-api-test-")
+os.environ["TEMP_DIR"] = TEMP_DIR
+os.environ["AUDIO_CACHE_ENABLED"] = "1"
+os.environ["DOWNLOAD_STREAMING"] = "0"
+
+import app  # noqa: E402  (configured from the environment on import)
+import janitor  # noqa: E402
+
+VIDEO_ID = "dQw4w9WgXcQ"
+URL = f"/downloads?url=https://www.youtube.com/watch?v={VIDEO_ID}"
+MP3 = bytes(range(256)) * 1024
+
+class DownloadCleanupTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.client = app.app.test_client()
+        app.audio_store.write(app.audio_cache_name(VIDEO_ID), MP3)
+    
+    def tearDown(self):
+        app.audio_store.remove(app.audio_cache_name(VIDEO_ID))
+    
+    def assertReleased(self):
+        self.assertEqual(app.audio_store.stats()["pinned"], 0)
+        self.assertEqual([name for name in os.listdir(TEMP_DIR) if janitor.is_work_dir_name(name)], [])
+        self.assertEqual(janitor._held_locks, {})
+    
+    def get(self, url=URL, **kwargs):
+        response = self.client.get(url, **kwargs)
+        body = response.get_data()
+        response.close()
+        return response, body
+    
+    def test_cached_download(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, MP3)
+        self.assertReleased()
+    
+    def test_cached_range(self):
+        response, body = self.get(headers={"Range": "bytes=100-199"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, MP3[100:200])
+        self.assertReleased()
+    
+    def test_cached_head(self):
+        response = self.client.head(URL)
+        response.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertReleased()
+    
+    def test_cached_not_modified(self):
+        etag = self.get()[0].headers["ETag"]
+        response, _ = self.get(headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertReleased()
+    
+    def test_abandoned_download(self):
+        # The client goes away after the first block
+        response = self.client.get(URL, buffered=False)
+        next(iter(response.response))
+        response.close()
+        self.assertReleased()
+    
+    def test_uncached_download(self):
+        # A file that couldn't be cached is sent from the request's work directory
+        def download_audio(youtube_url, temp_dir, transcode=True, pins=None):
+            path = os.path.join(temp_dir, "audio.mp3")
+            with open(path, "wb") as f:
+                f.write(MP3)
+            return path
+        
+        original = app.download_audio
+        app.download_audio = download_audio
+        app.audio_store.remove(app.audio_cache_name(VIDEO_ID))
+        try:
+            response, body = self.get()
+        finally:
+            app.download_audio = original
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, MP3)
+        self.assertReleased()
+
+if __name__ == "__main__":
+    try:
+        unittest.main()
+    finally:
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)